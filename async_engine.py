@@ -0,0 +1,311 @@
+import os
+import asyncio
+import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from tenacity import retry, stop_after_attempt, wait_exponential
+import youtube_transcriber as yt
+import metrics
+from rate_limiter import get_default_limiter
+from transcript_cache import get_default_cache
+from workspace import Workspace, BUDGET_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Constants
+MAX_INFLIGHT_CHUNKS = 256  # Chunks being uploaded or transcribed at once, across every video on the loop
+MAX_UPLOADS = 16  # Uploads and roster calls at once; they have no async client, so each one holds a thread
+MAX_DOWNLOADS = 8  # yt-dlp downloads and caption fetches at once, each on a thread
+MAX_SPLITS = max(1, min(4, os.cpu_count() or 1))  # ffmpeg runs at once, each waited on from a thread
+SHORT_CALL_THREADS = 8  # Threads left for short blocking calls (SQLite, ffprobe, hashing, file writes)
+CANCEL_POLL_INTERVAL = 1.0  # Seconds between cancellation checks while pausing
+
+_END = object()
+_default_engine = None
+
+async def sleep_unless_cancelled(seconds, cancel_event=None):
+    """Sleep on the loop, raising JobCancelled as soon as the job is cancelled."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while True:
+        yt.check_cancelled(cancel_event)
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(CANCEL_POLL_INTERVAL, remaining))
+
+class AsyncEngine:
+    """Transcribe videos on an asyncio event loop instead of a thread per chunk.
+
+    Generation calls use Gemini's async methods and wait for the rate limit with
+    asyncio.sleep, so a single loop can keep hundreds of chunks in flight. Work
+    with no async API (downloads, ffmpeg, uploads, SQLite) runs on the engine's
+    own thread pool. Long calls are capped per kind by semaphores, and the pool
+    has a thread for each of those slots plus SHORT_CALL_THREADS, so cache and
+    rate limiter calls never queue behind a batch of uploads. Planning, prompts,
+    cache keys and the finished transcript come from youtube_transcriber's
+    helpers; only how each step waits differs, so results, caching and error
+    handling match the threaded path.
+    """
+
+    def __init__(self, max_inflight_chunks=MAX_INFLIGHT_CHUNKS, max_uploads=MAX_UPLOADS,
+                 max_downloads=MAX_DOWNLOADS, max_splits=MAX_SPLITS, limiter=None):
+        self.chunk_slots = asyncio.Semaphore(max_inflight_chunks)
+        self.upload_slots = asyncio.Semaphore(max_uploads)
+        self.download_slots = asyncio.Semaphore(max_downloads)
+        self.split_slots = asyncio.Semaphore(max_splits)
+        self.limiter = limiter or get_default_limiter()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_uploads + max_downloads + max_splits + SHORT_CALL_THREADS,
+            thread_name_prefix="async-engine",
+        )
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """Run a blocking call on the engine's threads, like asyncio.to_thread."""
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, function, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def rate_limited_call(self, client, model_name, estimated_tokens, call):
+        """Await a generation call inside the shared rate limit and settle its token usage."""
+        with metrics.span("rate_limit_wait"):
+            await self.limiter.acquire_async(client.api_key, model_name, estimated_tokens, self.run_blocking)
+        try:
+            with metrics.span("generate", model=model_name):
+                response = await call()
+        except Exception as e:
+            await self.run_blocking(yt.record_failure, client, model_name, e, self.limiter)
+            raise
+        return await self.run_blocking(yt.record_usage, client, model_name, estimated_tokens, response, self.limiter)
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), before_sleep=metrics.count_retry("generate"))
+    async def process_file_with_retry(self, client, model, file, prompt, estimated_tokens=0, model_name=yt.MODEL_NAME, generation_config=None):
+        try:
+            logger.debug(f"Processing: {file.display_name}")
+            return await self.rate_limited_call(
+                client, model_name, estimated_tokens,
+                lambda: model.generate_content_async([file, prompt], generation_config=generation_config),
+            )
+        except Exception as e:
+            logger.error(f"Processing failed for {file.display_name}: {str(e)}")
+            raise
+
+    async def get_speaker_roster(self, pool, metadata, cache):
+        # One short text call per video, made with the sync client rather than on the loop
+        async with self.upload_slots:
+            return await self.run_blocking(yt.get_speaker_roster, pool, metadata, cache)
+
+    async def upload_chunk(self, client, chunk_path, content_hash, model_name=None):
+        async with self.upload_slots:
+            return await self.run_blocking(yt.upload_chunk, client, chunk_path, content_hash, model_name=model_name)
+
+    async def split(self, chunks):
+        """Yield chunks from one of youtube_transcriber's chunk iterators, running each ffmpeg cut on a thread."""
+        chunks = iter(chunks)
+        while True:
+            async with self.split_slots:
+                chunk = await self.run_blocking(next, chunks, _END)
+            if chunk is _END:
+                return
+            yield chunk
+
+    async def transcribe_chunk(self, pool, chunk_path, part, total_parts, video_id=None, cache=None, cancel_event=None, on_progress=None, duration=None, speech=None, roster="", depth=0):
+        """Async counterpart of youtube_transcriber.transcribe_chunk, with the same cache keys, so both engines share cached chunks."""
+        yt.check_cancelled(cancel_event)
+        content_hash, cached = await self.run_blocking(
+            yt.find_cached_chunk, chunk_path, part, total_parts, pool.model_names, video_id, cache, roster, on_progress,
+        )
+        if cached is not None:
+            return cached
+
+        estimated_tokens = yt.chunk_token_estimate(duration)
+        backend = await self.run_blocking(pool.choose, estimated_tokens)
+        client = backend.client
+        file = await self.upload_chunk(client, chunk_path, content_hash, backend.model_name)
+        try:
+            yt.emit(on_progress, "chunk_uploaded", part=part, total=total_parts)
+
+            response = await self.process_file_with_retry(
+                client, backend.async_model(), file, yt.chunk_prompt(part, total_parts, roster), estimated_tokens,
+                backend.model_name, yt.chunk_generation_config(),
+            )
+            transcript, truncated = yt.read_chunk_response(response, duration, speech)
+            if truncated:
+                transcript = await self.transcribe_in_halves(
+                    pool, chunk_path, part, total_parts, video_id, cache, cancel_event, duration, roster, depth
+                ) or transcript
+            await self.run_blocking(yt.cache_chunk, cache, video_id, content_hash, backend.model_name, roster, transcript)
+        except BaseException:
+            # Keep the upload for the next attempt at this chunk; with delete=False this makes no remote call
+            yt.release_upload(client, file, content_hash, delete=False)
+            raise
+        await self.run_blocking(yt.finish_chunk, client, file, content_hash, chunk_path, part, total_parts, transcript, on_progress)
+        return transcript
+
+    async def transcribe_in_halves(self, pool, chunk_path, part, total_parts, video_id=None, cache=None, cancel_event=None, duration=None, roster="", depth=0):
+        """Async counterpart of youtube_transcriber.transcribe_in_halves.
+
+        The halves run one after the other inside the chunk's slot, so a chunk
+        never waits for a slot held by its own parent.
+        """
+        async with self.split_slots:
+            plan = await self.run_blocking(yt.plan_resplit, chunk_path, part, total_parts, duration, depth)
+        if plan is None:
+            return None
+        halves = []
+        try:
+            async for half in self.split(yt.iter_planned_chunks(chunk_path, None, plan=plan)):
+                halves.append(half)
+            transcripts = []
+            for half in halves:
+                transcripts.append(await self.transcribe_chunk(
+                    pool, half["path"], part, total_parts, video_id, cache, cancel_event,
+                    duration=half["duration"], speech=half["speech"], roster=roster, depth=depth + 1,
+                ))
+            return yt.merge_halves(halves, transcripts)
+        finally:
+            yt.remove_chunk_files(halves)
+
+    async def transcribe_chunk_with_retries(self, pool, chunk, part, total_parts, video_id=None, cache=None, cancel_event=None, on_progress=None, roster="", entry_log=None, rounds=yt.CHUNK_RETRY_ROUNDS):
+        """Async counterpart of youtube_transcriber.transcribe_chunk_with_retries; the slot is given up during pauses."""
+        for attempt in range(rounds + 1):
+            try:
+                async with self.chunk_slots:
+                    result = await self.transcribe_chunk(
+                        pool, chunk["path"], part, total_parts, video_id, cache, cancel_event, on_progress,
+                        chunk["duration"], chunk["speech"], roster,
+                    )
+            except yt.JobCancelled:
+                raise
+            except Exception as e:
+                if attempt == rounds:
+                    raise
+                await sleep_unless_cancelled(yt.chunk_retry_pause(e, attempt, part, total_parts), cancel_event)
+            else:
+                return await self.run_blocking(yt.record_chunk, result, chunk, part, entry_log)
+
+    async def process_audio_file(self, audio_path, original_title=None, video_id=None, cache=None, duration=None, speech_optimize=yt.SPEECH_OPTIMIZE, cancel_event=None, on_progress=None, client=None, metadata=None):
+        try:
+            pool = yt.resolve_pool(client)
+            split = await self.run_blocking(yt.plan_split, audio_path, video_id, cache, duration, speech_optimize)
+            total_parts = split["total_parts"]
+
+            chunks = []
+            tasks = []
+            entry_log = await self.run_blocking(yt.open_entry_log, audio_path, original_title, video_id)
+            roster_task = asyncio.create_task(self.get_speaker_roster(pool, metadata, cache))
+            try:
+                # Start transcribing each chunk as soon as ffmpeg has written it
+                with metrics.span("split"):
+                    async for chunk in self.split(split["chunks"]):
+                        chunks.append(chunk)
+                        yt.check_cancelled(cancel_event)
+                        tasks.append(asyncio.create_task(self.transcribe_chunk_with_retries(
+                            pool, chunk, len(chunks), max(total_parts, len(chunks)), video_id, cache, cancel_event, on_progress,
+                            await roster_task, entry_log,
+                        )))
+                yt.emit(on_progress, "split", chunks=len(chunks))
+                if split["plan"] is None:
+                    await self.run_blocking(yt.save_chunk_plan, cache, video_id, chunks, await roster_task)
+
+                # A chunk that fails every retry leaves a gap instead of losing the others
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                roster_task.cancel()
+                for task in tasks:
+                    task.cancel()
+                yt.remove_chunk_files(chunks)
+
+            all_transcripts = []
+            errors = {}
+            for index, result in enumerate(results):
+                if isinstance(result, yt.JobCancelled):
+                    raise result
+                if isinstance(result, BaseException):
+                    yt.give_up_on_chunk(errors, index, len(chunks), result)
+                    result = None
+                all_transcripts.append(result)
+            return await self.run_blocking(
+                yt.finish_transcript, all_transcripts, audio_path, original_title, video_id, cache,
+                errors=errors, entry_log=entry_log,
+            )
+
+        except (yt.JobCancelled, yt.IncompleteTranscript) as e:
+            if isinstance(e, yt.JobCancelled):
+                logger.info(f"Cancelled processing of {audio_path}")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to process {audio_path}: {str(e)}")
+            return None
+
+    async def open_workspace(self, disk_budget=None, cancel_event=None):
+        """Open a workspace, polling the disk budget from the loop instead of blocking a thread on it."""
+        workspace = Workspace(disk_budget)
+        while True:
+            if await self.run_blocking(workspace.try_open) is not None:
+                return workspace
+            await sleep_unless_cancelled(BUDGET_POLL_INTERVAL, cancel_event)
+
+    async def process_youtube_url(self, url, cache=None, cancel_event=None, on_progress=None, client=None, captions_mode=yt.CAPTIONS_MODE, disk_budget=None):
+        """Async counterpart of youtube_transcriber.process_youtube_url, returning (success, transcript)."""
+        if cache is None:
+            cache = get_default_cache()
+        workspace = None
+        audio_path = None
+        try:
+            # A cache hit holds the slot only briefly; captions are a download of their own
+            async with self.download_slots:
+                video_id, transcript_content = await self.run_blocking(
+                    yt.transcribe_without_audio, url, cache, client, captions_mode, on_progress,
+                )
+            if transcript_content is not None:
+                metrics.inc("videos_total", result="succeeded")
+                return True, transcript_content
+            yt.check_cancelled(cancel_event)
+
+            workspace = await self.open_workspace(disk_budget, cancel_event)
+            async with self.download_slots:
+                audio_path, metadata = await self.run_blocking(yt.download_audio, url, workspace.path)
+            if not audio_path:
+                logger.error(f"Failed to download audio for {url}")
+                metrics.inc("videos_total", result="failed")
+                return False, None
+            yt.emit(on_progress, "downloaded", title=metadata["title"], duration=metadata["duration"])
+            yt.check_cancelled(cancel_event)
+
+            transcript_content = await self.process_audio_file(
+                audio_path,
+                metadata["title"],
+                video_id=metadata["id"] or video_id,
+                cache=cache,
+                duration=metadata["duration"],
+                cancel_event=cancel_event,
+                on_progress=on_progress,
+                client=client,
+                metadata=metadata,
+            )
+            metrics.inc("videos_total", result="failed" if transcript_content is None else "succeeded")
+            return transcript_content is not None, transcript_content
+
+        except yt.IncompleteTranscript as e:
+            return yt.incomplete_result(url, e, on_progress)
+
+        except yt.JobCancelled:
+            metrics.inc("videos_total", result="cancelled")
+            raise
+        except Exception as e:
+            metrics.inc("videos_total", result="failed")
+            logger.error(f"Error processing {url}: {str(e)}")
+            return False, None
+        finally:
+            if audio_path and os.path.exists(audio_path):
+                os.remove(audio_path)
+            if workspace is not None:
+                workspace.close()
+
+def get_default_engine():
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = AsyncEngine()
+    return _default_engine
@@ -0,0 +1,84 @@
+"""Check that the entry points import fast and leave the heavy SDKs for later.
+
+Each module is imported in a fresh interpreter with -X importtime. The script
+reports the median cumulative import time over a few runs and the slowest
+packages involved. It exits with status 1 when a module goes over its budget
+or imports one of the deferred packages at startup, so it can run in CI.
+
+    python benchmarks/bench_imports.py
+    python benchmarks/bench_imports.py --runs 10 --budget main=800
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds each entry point may take to import; main.py includes FastAPI itself
+BUDGETS = {
+    "youtube_transcriber": 300,
+    "pipeline": 300,
+    "async_engine": 300,
+    "main": 1200,
+}
+# Packages that must only be imported once they are actually used
+DEFERRED = ("google.generativeai", "google.api_core", "yt_dlp", "youtube_transcript_api", "requests", "tqdm")
+
+def import_profile(module):
+    """Import `module` in a new interpreter and return ({package: cumulative µs}, deferred packages it loaded)."""
+    code = f"import sys, json, {module}; print(json.dumps([m for m in {DEFERRED!r} if m in sys.modules]))"
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True,
+    )
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented, so strip the name; each module is only listed once
+        cumulative.setdefault(name.strip(), int(cumulative_us))
+    loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+    return cumulative, loaded
+
+def measure(module, runs):
+    totals = []
+    for _ in range(runs):
+        cumulative, loaded = import_profile(module)
+        totals.append(cumulative.get(module, 0) / 1000)
+    heaviest = sorted(
+        ((name, us / 1000) for name, us in cumulative.items() if name != module and "." not in name),
+        key=lambda item: item[1], reverse=True,
+    )[:5]
+    return {"module": module, "ms": round(statistics.median(totals), 1), "heaviest": heaviest, "deferred_loaded": loaded}
+
+def parse_budget(value):
+    module, _, ms = value.partition("=")
+    return module, float(ms)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time of the entry points against a budget.")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS), help="Modules to import (default: all entry points)")
+    parser.add_argument("--runs", type=int, default=5, help="Imports per module; the median is reported")
+    parser.add_argument("--budget", type=parse_budget, action="append", default=[], metavar="MODULE=MS", help="Override a module's budget")
+    args = parser.parse_args(argv)
+    budgets = {**BUDGETS, **dict(args.budget)}
+
+    failed = False
+    for module in args.modules:
+        result = measure(module, args.runs)
+        budget = budgets.get(module)
+        over = budget is not None and result["ms"] > budget
+        status = "FAIL" if over or result["deferred_loaded"] else "ok"
+        failed = failed or status == "FAIL"
+        print(f"{status:4}  {module:20} {result['ms']:8.1f} ms  (budget {budget if budget is not None else '-'} ms)")
+        print("      slowest: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in result["heaviest"]))
+        if result["deferred_loaded"]:
+            print(f"      imported at startup: {', '.join(result['deferred_loaded'])}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Measure the batch pipeline's throughput and latency against local fakes.
+
+Downloads are served from generated audio and Gemini is replaced by a fake with
+configurable latency and failure rates, so runs cost nothing and are repeatable.
+ffmpeg still does the real splitting. Every combination of the comma-separated
+settings runs in its own process, so peak memory is measured per configuration.
+With --engine async the videos go through the asyncio engine all at once
+instead, and --transcribe-workers caps the chunks it has in flight.
+
+    python benchmarks/bench_pipeline.py --videos 20 --lengths 600,2700 --transcribe-workers 4,8,16
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import itertools
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+SWEEP_OPTIONS = ("download_workers", "split_workers", "transcribe_workers", "chunk_minutes", "rpm")
+PERCENTILES = (50, 90, 99)
+
+def int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+class Timings:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def timed(self, stage, function):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return wrapper
+
+    def timed_iter(self, stage, function):
+        """Time a generator from its first item being asked for until it is exhausted or closed."""
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return wrapper
+
+    def timed_async(self, stage, function):
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return wrapper
+
+    def summary(self):
+        return {
+            stage: {
+                **{f"p{pct}": round(percentile(values, pct), 3) for pct in PERCENTILES},
+                "max": round(max(values), 3),
+                "count": len(values),
+            }
+            for stage, values in self.samples.items()
+        }
+
+def run_single(args):
+    """Run one configuration in this process and return its results."""
+    work_dir = tempfile.mkdtemp(prefix="y2t-bench-")
+    # Set before the project modules read them at import time
+    os.environ["TRANSCRIPT_CACHE"] = "0"
+    os.environ["RATE_LIMIT_PATH"] = os.path.join(work_dir, "ratelimit.sqlite3")
+    os.environ["UPLOAD_REGISTRY_PATH"] = os.path.join(work_dir, "uploads.sqlite3")
+    os.environ["AUDIO_OUTPUT_DIR"] = os.path.join(work_dir, "workspaces")
+    os.environ["GEMINI_RPM"] = str(args.rpm)
+    os.environ["GEMINI_TPM"] = str(args.tpm)
+
+    import youtube_transcriber as yt
+    import pipeline
+    import async_engine
+    from fakes import FakeGemini, FakeDownloader
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    timings = Timings()
+    started_at = {}
+
+    downloader = FakeDownloader(work_dir, args.lengths, latency=args.download_latency)
+    def download(url, *download_args, **download_kwargs):
+        started_at[url] = time.perf_counter()
+        return downloader(url, *download_args, **download_kwargs)
+
+    gemini = FakeGemini(
+        latency=args.latency, jitter=args.jitter, upload_latency=args.upload_latency,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        tokens_per_minute=args.tokens_per_minute, seed=args.seed,
+    )
+
+    yt.download_audio = timings.timed("download", download)
+    yt.transcribe_chunk = timings.timed("transcribe", yt.transcribe_chunk)
+    # Both engines cut chunks through iter_chunks, so this times every video's split
+    yt.iter_chunks = timings.timed_iter("split", yt.iter_chunks)
+    yt.save_transcript = lambda transcript, base_name: None
+    yt.CHUNK_DURATION = yt.MAX_CHUNK_DURATION = args.chunk_minutes * 60
+    yt.ADAPTIVE_CHUNKS = not args.fixed_chunks
+    yt.STRUCTURED_OUTPUT = args.structured
+    yt.TRANSCRIPT_DIR = os.path.join(work_dir, "transcripts")
+
+    results = []
+    def on_result(url, success, transcript, error):
+        results.append(success)
+        if url in started_at:
+            timings.record("video", time.perf_counter() - started_at[url])
+
+    urls = [f"https://www.youtube.com/watch?v=bench{i:06d}" for i in range(args.videos)]
+    # Generate the source audio up front so it isn't counted as download time
+    for seconds in set(args.lengths):
+        downloader._source(seconds)
+
+    async def run_async():
+        engine = async_engine.AsyncEngine(
+            max_inflight_chunks=args.transcribe_workers, max_downloads=args.download_workers, max_splits=args.split_workers,
+        )
+        engine.transcribe_chunk = timings.timed_async("transcribe", engine.transcribe_chunk)
+        async def process(url):
+            success, transcript = await engine.process_youtube_url(url, client=gemini)
+            on_result(url, success, transcript, None)
+        await asyncio.gather(*(process(url) for url in urls))
+
+    started = time.perf_counter()
+    try:
+        if args.engine == "async":
+            asyncio.run(run_async())
+        else:
+            pipeline.Pipeline(
+                gemini, on_result=on_result,
+                download_workers=args.download_workers, split_workers=args.split_workers,
+                transcribe_workers=args.transcribe_workers,
+            ).run(urls)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    elapsed = time.perf_counter() - started
+
+    api_calls = sum(count for kind, count in gemini.calls.items() if not kind.endswith(("_429", "_error")))
+    return {
+        **{option: getattr(args, option) for option in SWEEP_OPTIONS},
+        "engine": args.engine,
+        "adaptive_chunks": not args.fixed_chunks,
+        "structured": args.structured,
+        "videos": args.videos,
+        "succeeded": sum(results),
+        "seconds": round(elapsed, 2),
+        "videos_per_hour": round(args.videos / elapsed * 3600, 1) if elapsed else None,
+        "latency": timings.summary(),
+        "api_calls": dict(gemini.calls),
+        "api_calls_per_video": round(api_calls / args.videos, 2),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+def run_sweep(args, argv):
+    """Run every combination of the swept settings, each in a fresh process."""
+    sweeps = {option: getattr(args, option) for option in SWEEP_OPTIONS}
+    results = []
+    for values in itertools.product(*sweeps.values()):
+        setting = dict(zip(sweeps, values))
+        # argparse keeps the last occurrence of a flag, so these override the swept lists in argv
+        command = [sys.executable, os.path.abspath(__file__), "--single", *argv]
+        for option, value in setting.items():
+            command += [f"--{option.replace('_', '-')}", str(value)]
+        print(f"Running {', '.join(f'{k}={v}' for k, v in setting.items())}", file=sys.stderr)
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return results
+
+def print_table(results):
+    header = ["dl", "split", "tx", "chunk", "rpm", "ok", "videos/h", "video p50", "video p90", "tx p90", "calls/video", "rss MB"]
+    rows = []
+    for result in results:
+        latency = result["latency"]
+        rows.append([
+            result["download_workers"], result["split_workers"], result["transcribe_workers"],
+            f"{result['chunk_minutes']}m", result["rpm"],
+            f"{result['succeeded']}/{result['videos']}", result["videos_per_hour"],
+            latency.get("video", {}).get("p50"), latency.get("video", {}).get("p90"),
+            latency.get("transcribe", {}).get("p90"), result["api_calls_per_video"],
+            result["peak_rss_mb"],
+        ])
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    for row in [header, *rows]:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the batch pipeline against a fake Gemini and fake downloads.")
+    parser.add_argument("--videos", type=int, default=10, help="Videos per run")
+    parser.add_argument("--lengths", type=int_list, default=[600, 1800], help="Video lengths in seconds to cycle through")
+    parser.add_argument("--download-workers", type=int_list, default=[4], help="Values to try, comma separated")
+    parser.add_argument("--split-workers", type=int_list, default=[2], help="Values to try, comma separated")
+    parser.add_argument("--transcribe-workers", type=int_list, default=[8], help="Values to try, comma separated")
+    parser.add_argument("--chunk-minutes", type=int_list, default=[20], help="Longest chunk to try, comma separated")
+    parser.add_argument("--rpm", type=int_list, default=[108], help="Requests per minute to allow, comma separated")
+    parser.add_argument("--tpm", type=int, default=1000000, help="Tokens per minute to allow")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads", help="Staged thread pipeline or the asyncio engine")
+    parser.add_argument("--fixed-chunks", action="store_true", help="Disable adaptive chunk sizing")
+    parser.add_argument("--structured", action="store_true", help="Ask for JSON entries and write them to JSONL, SRT and WebVTT")
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds per fake generate call")
+    parser.add_argument("--upload-latency", type=float, default=0.3, help="Seconds per fake upload")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Random extra seconds added to each call")
+    parser.add_argument("--download-latency", type=float, default=0.5, help="Seconds per fake download")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls failing with a 429")
+    parser.add_argument("--tokens-per-minute", type=int, default=250, help="Transcript tokens per minute of audio")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the fake's latency and failures")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's own logging")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.single:
+        for option in SWEEP_OPTIONS:
+            setattr(args, option, getattr(args, option)[0])
+    return args
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.single:
+        print(json.dumps(run_single(args)))
+        return
+    results = run_sweep(args, argv)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import random
+import asyncio
+import shutil
+import threading
+import subprocess
+from collections import Counter
+from types import SimpleNamespace
+from google.api_core import exceptions as api_exceptions
+
+# Constants
+TONE_SECONDS = 6  # Generated audio is a tone for this long...
+PAUSE_SECONDS = 1  # ...followed by this much silence, so silencedetect has pauses to find
+WORDS_PER_TOKEN = 0.75
+WORDS_PER_TURN = 40
+FILLER_WORDS = "so the idea was that we would start small and then see what actually works in practice".split()
+
+class FakeGemini:
+    """Stand-in for GeminiClient that answers locally after a configurable delay.
+
+    Every call sleeps for `latency` seconds (plus up to `jitter`), then fails with
+    a 429 with probability `rate_limit_rate`, with a 500 with probability
+    `error_rate`, and otherwise succeeds. Transcripts are filler text sized at
+    `tokens_per_minute` of audio, cut off at the model's max_output_tokens like
+    the real API would. Calls are counted by kind in `calls`.
+    """
+
+    def __init__(self, latency=1.0, jitter=0.5, upload_latency=0.3, error_rate=0.0,
+                 rate_limit_rate=0.0, tokens_per_minute=250, seed=None):
+        self.api_key = "benchmark"
+        self.latency = latency
+        self.jitter = jitter
+        self.upload_latency = upload_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.tokens_per_minute = tokens_per_minute
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._files = {}
+
+    def _roll(self, kind, latency):
+        with self._lock:
+            self.calls[kind] += 1
+            return latency + self._random.uniform(0, self.jitter), self._random.random()
+
+    def _call(self, kind, latency):
+        delay, roll = self._roll(kind, latency)
+        time.sleep(delay)
+        self._fail(kind, roll)
+
+    async def _call_async(self, kind, latency):
+        delay, roll = self._roll(kind, latency)
+        await asyncio.sleep(delay)
+        self._fail(kind, roll)
+
+    def _fail(self, kind, roll):
+        if roll < self.rate_limit_rate:
+            with self._lock:
+                self.calls[f"{kind}_429"] += 1
+            raise api_exceptions.TooManyRequests("Resource has been exhausted (benchmark)")
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.calls[f"{kind}_error"] += 1
+            raise api_exceptions.InternalServerError("Internal error (benchmark)")
+
+    def upload_file(self, path, mime_type=None):
+        self._call("upload", self.upload_latency)
+        with self._lock:
+            name = f"files/benchmark-{self.calls['upload']}"
+            self._files[name] = probe_duration(path)
+        return SimpleNamespace(name=name, display_name=os.path.basename(path), mime_type=mime_type, state=SimpleNamespace(name="ACTIVE"))
+
+    def get_file(self, name):
+        self._call("get_file", 0)
+        with self._lock:
+            if name not in self._files:
+                raise api_exceptions.NotFound(f"{name} not found (benchmark)")
+        return SimpleNamespace(name=name, display_name=name, state=SimpleNamespace(name="ACTIVE"))
+
+    def delete_file(self, name):
+        self._call("delete", 0)
+        with self._lock:
+            self._files.pop(name, None)
+
+    def generative_model(self, model_name, generation_config=None, **kwargs):
+        return FakeModel(self, (generation_config or {}).get("max_output_tokens", 8192))
+
+    async_generative_model = generative_model
+
+    def respond(self, parts, max_output_tokens, structured=False):
+        self._call("generate", self.latency)
+        return self._response(parts, max_output_tokens, structured)
+
+    async def respond_async(self, parts, max_output_tokens, structured=False):
+        await self._call_async("generate", self.latency)
+        return self._response(parts, max_output_tokens, structured)
+
+    def _response(self, parts, max_output_tokens, structured=False):
+        seconds = sum(self._files.get(getattr(part, "name", None), 0) for part in parts)
+        wanted = int(seconds / 60 * self.tokens_per_minute) or 50
+        tokens = min(wanted, max_output_tokens)
+        if structured:
+            text = structured_text(wanted, seconds)
+            # Cut the JSON off where the output limit would, mid-entry like the real API
+            text = text[:int(len(text) * tokens / wanted)]
+        else:
+            words = int(tokens * WORDS_PER_TOKEN)
+            lines = [
+                f"**Speaker {turn % 2 + 1}:** " + filler_text(turn, min(WORDS_PER_TURN, words - start))
+                for turn, start in enumerate(range(0, words, WORDS_PER_TURN))
+            ]
+            text = "\n\n".join(lines)
+        return SimpleNamespace(
+            text=text,
+            candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name="MAX_TOKENS" if wanted > max_output_tokens else "STOP"))],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=int(seconds * 32),
+                candidates_token_count=tokens,
+                total_token_count=int(seconds * 32) + tokens,
+            ),
+        )
+
+class FakeModel:
+    def __init__(self, gemini, max_output_tokens):
+        self.gemini = gemini
+        self.max_output_tokens = max_output_tokens
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        contents = contents if isinstance(contents, list) else [contents]
+        return self.gemini.respond(contents, self.max_output_tokens, is_structured(generation_config))
+
+    async def generate_content_async(self, contents, generation_config=None, **kwargs):
+        contents = contents if isinstance(contents, list) else [contents]
+        return await self.gemini.respond_async(contents, self.max_output_tokens, is_structured(generation_config))
+
+def is_structured(generation_config):
+    return (generation_config or {}).get("response_mime_type") == "application/json"
+
+def filler_text(turn, count):
+    """`count` filler words, starting at a different word for each turn so turns don't all read the same."""
+    return " ".join(FILLER_WORDS[(turn * 7 + i) % len(FILLER_WORDS)] for i in range(count))
+
+def structured_text(tokens, seconds):
+    """Filler turns as the JSON a structured chunk call returns, spread evenly over `seconds` of audio."""
+    turns = max(1, int(tokens * WORDS_PER_TOKEN) // WORDS_PER_TURN)
+    step = seconds / turns
+    timestamp = lambda t: f"{int(t) // 60:02d}:{int(t) % 60:02d}"
+    return json.dumps([
+        {"speaker": f"Speaker {i % 2 + 1}", "text": filler_text(i, WORDS_PER_TURN), "start": timestamp(i * step), "end": timestamp((i + 1) * step)}
+        for i in range(turns)
+    ])
+
+def probe_duration(path):
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip())
+
+def generate_audio(path, seconds):
+    """Write `seconds` of tone with regular pauses to an m4a file, the same container YouTube serves."""
+    period = TONE_SECONDS + PAUSE_SECONDS
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=44100:duration={seconds}",
+        "-af", f"volume='if(lt(mod(t,{period}),{TONE_SECONDS}),1,0)':eval=frame",
+        "-c:a", "aac", "-b:a", "128k",
+        path,
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+
+class FakeDownloader:
+    """Replacement for download_audio that serves generated audio instead of YouTube's.
+
+    `lengths` are the video lengths in seconds to cycle through. Each length is
+    generated once and copied for every video, after `latency` seconds.
+    """
+
+    def __init__(self, work_dir, lengths, latency=0.5):
+        self.work_dir = work_dir
+        self.lengths = list(lengths)
+        self.latency = latency
+        self._count = 0
+        self._lock = threading.Lock()
+        self._generated = {}
+
+    def _source(self, seconds):
+        with self._lock:
+            path = self._generated.get(seconds)
+            if path is None:
+                path = os.path.join(self.work_dir, f"source-{seconds}.m4a")
+                generate_audio(path, seconds)
+                self._generated[seconds] = path
+            return path
+
+    def __call__(self, url, output_path=None, native_audio=True):
+        with self._lock:
+            seconds = self.lengths[self._count % len(self.lengths)]
+            self._count += 1
+        source = self._source(seconds)
+        time.sleep(self.latency)
+        video_id = url.rsplit("=", 1)[-1]
+        path = os.path.join(output_path or self.work_dir, f"{video_id}.m4a")
+        shutil.copyfile(source, path)
+        metadata = {
+            "id": video_id,
+            "title": video_id,
+            "duration": seconds,
+            "chapters": [],
+            "uploader": "benchmark",
+            "webpage_url": url,
+        }
+        return path, metadata
@@ -0,0 +1,76 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Constants
+CAPTION_MODES = ("off", "manual", "any")  # Which caption tracks may replace audio transcription
+CAPTION_LANGUAGES = ("en",)  # Preferred caption languages; otherwise the first track is used
+MIN_CAPTION_WORDS_PER_MINUTE = 40  # Auto captions sparser than this are usually music or noise
+
+def fetch_captions(video_id, mode, languages=CAPTION_LANGUAGES):
+    """Return the video's caption segments ({text, start, duration}) or None.
+
+    "manual" only accepts captions uploaded by the creator, "any" also accepts
+    YouTube's automatic captions when no manual track exists.
+    """
+    if mode == "off":
+        return None
+    from youtube_transcript_api import YouTubeTranscriptApi, CouldNotRetrieveTranscript
+    try:
+        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+    except CouldNotRetrieveTranscript as e:
+        logger.info(f"No captions for {video_id}: {type(e).__name__}")
+        return None
+
+    manual = [t for t in transcript_list if not t.is_generated]
+    generated = [t for t in transcript_list if t.is_generated]
+    candidates = manual + (generated if mode == "any" else [])
+    if not candidates:
+        return None
+    # Preferred languages first, otherwise keep the track order YouTube gives us
+    candidates.sort(key=lambda t: t.language_code.split("-")[0] not in languages)
+    transcript = candidates[0]
+
+    try:
+        segments = transcript.fetch()
+    except CouldNotRetrieveTranscript as e:
+        logger.info(f"Could not fetch captions for {video_id}: {type(e).__name__}")
+        return None
+
+    if transcript.is_generated and not captions_acceptable(segments):
+        logger.info(f"Automatic captions for {video_id} look unusable, falling back to audio")
+        return None
+    logger.info(f"Using {'automatic' if transcript.is_generated else 'manual'} {transcript.language_code} captions for {video_id}")
+    return segments
+
+def captions_acceptable(segments):
+    words = sum(len(segment["text"].split()) for segment in segments)
+    if not segments or words < 50:
+        return False
+    span = segments[-1]["start"] + segments[-1].get("duration", 0) - segments[0]["start"]
+    return span > 0 and words / (span / 60) >= MIN_CAPTION_WORDS_PER_MINUTE
+
+def group_captions(segments, chunk_duration):
+    """Join caption segments into one block of text per `chunk_duration` seconds."""
+    blocks = []
+    for segment in segments:
+        index = int(segment["start"] // chunk_duration)
+        while len(blocks) <= index:
+            blocks.append([])
+        blocks[index].append(segment["text"].replace("\n", " ").strip())
+    return [" ".join(block) for block in blocks if block]
+
+def fetch_title(video_id):
+    """Look up a video's title through oEmbed, which is much cheaper than a yt-dlp extraction."""
+    import requests
+    try:
+        response = requests.get(
+            "https://www.youtube.com/oembed",
+            params={"url": f"https://www.youtube.com/watch?v={video_id}", "format": "json"},
+            timeout=10,
+        )
+        response.raise_for_status()
+        return response.json().get("title")
+    except Exception as e:
+        logger.debug(f"oEmbed lookup failed for {video_id}: {str(e)}")
+        return None
@@ -0,0 +1,176 @@
+import re
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Constants
+SILENCE_NOISE_DB = -35  # Anything quieter than this counts as silence
+SILENCE_MIN_DURATION = 0.4  # Seconds of quiet needed to count as a pause
+SILENCE_SEARCH_WINDOW = 60  # Look this many seconds before each target cut for a pause
+MIN_CHUNK_DURATION = 2 * 60  # Chunks are never planned or re-split shorter than this, in seconds; a shorter tail joins the chunk before it if the speech budget allows
+TOKENS_PER_SPEECH_MINUTE = 250  # Starting guess at transcript tokens per minute of speech
+OUTPUT_TOKEN_TARGET = 0.8  # Fill this share of the output token limit, leaving room for faster talkers
+DENSITY_SMOOTHING = 0.2  # Weight of each new response in the running tokens-per-minute estimate
+MIN_OBSERVED_SPEECH = 60  # Seconds of speech a response needs before it counts towards the estimate
+
+SILENCE_START_PATTERN = re.compile(r"silence_start: (-?[\d.]+)")
+SILENCE_END_PATTERN = re.compile(r"silence_end: (-?[\d.]+)")
+
+def iter_silences(audio_path, noise_db=SILENCE_NOISE_DB, min_duration=SILENCE_MIN_DURATION):
+    """Yield (start, end) of every pause in the audio as ffmpeg's silencedetect finds it.
+
+    ffmpeg decodes the audio as a stream and reports pauses on stderr while it goes,
+    so this never holds the decoded audio in memory and the first pauses are
+    available long before the end of the file is reached.
+    """
+    command = [
+        "ffmpeg", "-hide_banner", "-nostats", "-nostdin",
+        "-i", audio_path,
+        "-map", "0:a",
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_duration}",
+        "-f", "null", "-",
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        silence_start = None
+        for line in process.stderr:
+            match = SILENCE_START_PATTERN.search(line)
+            if match:
+                silence_start = max(0.0, float(match.group(1)))
+                continue
+            match = SILENCE_END_PATTERN.search(line)
+            if match and silence_start is not None:
+                yield silence_start, float(match.group(1))
+                silence_start = None
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg silence detection failed for {audio_path}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+class SpeechDensity:
+    """Running estimate of how many transcript tokens a minute of speech turns into.
+
+    Each finished chunk reports the output tokens it used and the seconds of speech
+    it contained, and the estimate follows them with an exponential moving average.
+    """
+
+    def __init__(self, tokens_per_minute=TOKENS_PER_SPEECH_MINUTE, smoothing=DENSITY_SMOOTHING):
+        self.tokens_per_minute = tokens_per_minute
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def observe(self, output_tokens, speech_seconds):
+        if not output_tokens or not speech_seconds or speech_seconds < MIN_OBSERVED_SPEECH:
+            return
+        rate = output_tokens / (speech_seconds / 60)
+        with self._lock:
+            self.tokens_per_minute += self.smoothing * (rate - self.tokens_per_minute)
+        logger.debug(f"Observed {rate:.0f} tokens per minute of speech, estimate now {self.tokens_per_minute:.0f}")
+
+    def speech_budget(self, max_output_tokens, target=OUTPUT_TOKEN_TARGET):
+        """Return the seconds of speech whose transcript should fit in `max_output_tokens`."""
+        with self._lock:
+            tokens_per_minute = self.tokens_per_minute
+        return max(MIN_CHUNK_DURATION, target * max_output_tokens / tokens_per_minute * 60)
+
+_default_density = SpeechDensity()
+
+def get_default_density():
+    return _default_density
+
+def speech_seconds(start, end, silences):
+    """Return how much of [start, end) is not covered by the given silences."""
+    quiet = sum(max(0.0, min(silence_end, end) - max(silence_start, start)) for silence_start, silence_end in silences)
+    return end - start - quiet
+
+def _speech_target(start, max_end, silences, speech_budget):
+    """Return where `speech_budget` seconds of speech after `start` have passed, capped at `max_end`."""
+    if speech_budget is None:
+        return max_end
+    position = start
+    speech = 0.0
+    for silence_start, silence_end in silences:
+        if silence_end <= position:
+            continue
+        if silence_start >= max_end:
+            break
+        talking = max(0.0, silence_start - position)
+        if speech + talking >= speech_budget:
+            break
+        speech += talking
+        position = silence_end
+    target = position + speech_budget - speech
+    return min(max_end, max(target, start + MIN_CHUNK_DURATION))
+
+def _choose_cut(start, target, pauses, window):
+    """Pick the longest pause in the window before `target`, or cut at `target` if there is none."""
+    candidates = [(length, mid) for mid, length in pauses if start < mid <= target and mid >= target - window]
+    if not candidates:
+        return target
+    return max(candidates)[1]
+
+def _plan_cut(start, duration, chunk_duration, silences, window, speech_budget):
+    """Return where the chunk starting at `start` has to end at the latest, and where to cut it."""
+    target = _speech_target(start, min(start + chunk_duration, duration), silences, speech_budget)
+    pauses = [((silence_start + silence_end) / 2, silence_end - silence_start) for silence_start, silence_end in silences]
+    return target, _choose_cut(start, target, pauses, window)
+
+def split_span(duration, silences, window=SILENCE_SEARCH_WINDOW):
+    """Return the two (start, end, speech) spans a chunk of `duration` seconds is re-split into.
+
+    The cut goes at the longest pause within `window / 2` seconds of the middle,
+    or at the middle itself. Unlike iter_chunk_spans there is no budget and no
+    tail to fold, so this always gives exactly two spans.
+    """
+    silences = list(silences)
+    middle = duration / 2
+    pauses = [((silence_start + silence_end) / 2, silence_end - silence_start) for silence_start, silence_end in silences]
+    candidates = [(length, mid) for mid, length in pauses if abs(mid - middle) <= window / 2]
+    cut = max(candidates)[1] if candidates else middle
+    return [(0.0, cut, speech_seconds(0.0, cut, silences)), (cut, duration, speech_seconds(cut, duration, silences))]
+
+def iter_chunk_spans(duration, chunk_duration, silences, window=SILENCE_SEARCH_WINDOW, speech_budget=None):
+    """Yield (start, end, speech) spans that end in pauses.
+
+    Each cut is placed at the longest pause found in the `window` seconds before
+    the latest point the chunk may end, and only falls back to a hard cut during
+    continuous speech. With a `speech_budget` a chunk also ends once it holds that
+    many seconds of speech, so dense talk gets shorter chunks and quiet audio
+    longer ones. `speech` is the seconds of speech in the span. Spans are produced
+    as soon as the pauses needed to place them are known.
+
+    A last cut that would leave a tail shorter than MIN_CHUNK_DURATION is skipped
+    when the last chunk's speech, tail included, still fits in `speech_budget`,
+    so the tail doesn't cost an extra call of its own. Spans are therefore at most
+    `chunk_duration` long, except the last one, which can be up to
+    MIN_CHUNK_DURATION longer.
+    """
+    start = 0.0
+    known = []
+    for silence_start, silence_end in silences:
+        # Every pause before this one is known, so cuts that have to happen before it are settled
+        while True:
+            target, cut = _plan_cut(start, duration, chunk_duration, known, window, speech_budget)
+            if target >= duration or target >= silence_start or duration - cut < MIN_CHUNK_DURATION:
+                break
+            yield start, cut, speech_seconds(start, cut, known)
+            start = cut
+            known = [(s, e) for s, e in known if e > start]
+        known.append((silence_start, silence_end))
+
+    while True:
+        target, cut = _plan_cut(start, duration, chunk_duration, known, window, speech_budget)
+        if target >= duration:
+            break
+        # Only now is every pause known, so the tail's speech can be counted
+        if duration - cut < MIN_CHUNK_DURATION and (speech_budget is None or speech_seconds(start, duration, known) <= speech_budget):
+            break
+        yield start, cut, speech_seconds(start, cut, known)
+        start = cut
+        known = [(s, e) for s, e in known if e > start]
+    if duration - start > 0.5:
+        yield start, duration, speech_seconds(start, duration, known)
@@ -0,0 +1,103 @@
+import os
+import asyncio
+import logging
+import threading
+import weakref
+
+# google.generativeai pulls in gRPC and protobuf and takes about a second to
+# import, so it is only imported once the first client is built
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+class GeminiClient:
+    """Gemini connections for a single API key, built once and shared by every job using that key.
+
+    Nothing here touches genai's global configuration, so requests with different
+    keys can run side by side. The generative client keeps its HTTP session alive
+    between calls; file clients are kept per thread because their httplib2
+    transport is not thread-safe. Async generation goes over gRPC, with one
+    channel per event loop since a channel can't be shared between loops.
+    """
+
+    def __init__(self, api_key, transport="rest"):
+        if not api_key:
+            raise ValueError("A Gemini API key is required")
+        from google.generativeai import client as genai_client
+        self.api_key = api_key
+        self._manager = genai_client._ClientManager()
+        self._manager.configure(api_key=api_key, transport=transport)
+        self._local = threading.local()
+        self.generative_client = self._manager.make_client("generative")
+        self._async_manager = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_lock = threading.Lock()
+
+    @property
+    def file_client(self):
+        client = getattr(self._local, "file_client", None)
+        if client is None:
+            client = self._manager.make_client("file")
+            self._local.file_client = client
+        return client
+
+    @property
+    def generative_async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                if self._async_manager is None:
+                    from google.generativeai import client as genai_client
+                    self._async_manager = genai_client._ClientManager()
+                    self._async_manager.configure(api_key=self.api_key, transport="grpc_asyncio")
+                client = self._async_manager.make_client("generative_async")
+                self._async_clients[loop] = client
+            return client
+
+    def upload_file(self, path, mime_type=None):
+        from google.generativeai.types import file_types
+        response = self.file_client.create_file(
+            path, mime_type=mime_type, display_name=os.path.basename(path)
+        )
+        return file_types.File(response)
+
+    def get_file(self, name):
+        from google.generativeai.types import file_types
+        return file_types.File(self.file_client.get_file(name=name))
+
+    def delete_file(self, name):
+        self.file_client.delete_file(name=name)
+
+    def generative_model(self, model_name, generation_config=None, **kwargs):
+        import google.generativeai as genai
+        model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config, **kwargs)
+        # GenerativeModel has no public way to take a client, so hand it ours
+        model._client = self.generative_client
+        return model
+
+    def async_generative_model(self, model_name, generation_config=None, **kwargs):
+        """A model for generate_content_async, bound to the running event loop."""
+        import google.generativeai as genai
+        model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config, **kwargs)
+        model._async_client = self.generative_async_client
+        return model
+
+def preload():
+    """Import the Gemini SDK ahead of the first client, e.g. from a background thread after startup."""
+    import google.generativeai  # noqa: F401
+    from google.generativeai.types import file_types  # noqa: F401
+
+def get_client(api_key=None):
+    """Return the shared client for an API key, defaulting to GEMINI_API_KEY."""
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = GeminiClient(api_key)
+            _clients[api_key] = client
+        return client
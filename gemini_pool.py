@@ -0,0 +1,148 @@
+import time
+import random
+import logging
+import threading
+import metrics
+from rate_limiter import get_default_limiter, is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+# Constants
+RATE_LIMIT_COOLDOWN = 30  # Seconds a backend gets no new chunks after a 429
+FAILURE_THRESHOLD = 2  # Consecutive 5xx errors before a backend is taken out of rotation
+FAILURE_COOLDOWN = 30  # Seconds out of rotation after FAILURE_THRESHOLD errors, doubling with each further one
+MAX_COOLDOWN = 10 * 60  # Longest a backend is left out, also used for rejected keys
+MIN_SHARE = 0.05  # Share of its weight a backend with an empty rate limit bucket keeps, so it is still probed
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def parse_weighted(value):
+    """Parse "a,b:3,c" into {"a": 1, "b": 3, "c": 1}, for GEMINI_API_KEYS and GEMINI_MODELS."""
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.strip().partition(":")
+        if name:
+            weights[name] = float(weight) if weight else 1.0
+    return weights
+
+class BackendHealth:
+    """Recent errors per API key and model, shared by every pool in the process.
+
+    A 429 or a run of server errors puts the backend in a cooldown during which
+    pools stop choosing it; a successful call clears its record.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._cooldown_until = {}
+
+    def cooldown(self, api_key, model):
+        """Seconds until the backend is back in rotation, 0 if it is healthy."""
+        with self._lock:
+            return max(0.0, self._cooldown_until.get((api_key, model), 0) - time.time())
+
+    def record_success(self, api_key, model):
+        with self._lock:
+            self._failures.pop((api_key, model), None)
+
+    def record_failure(self, api_key, model, error):
+        status = getattr(error, "code", None)
+        with self._lock:
+            key = (api_key, model)
+            if is_rate_limit_error(error):
+                seconds = RATE_LIMIT_COOLDOWN
+            elif status in (401, 403):
+                # A revoked key or one without access to the model won't recover soon
+                seconds = MAX_COOLDOWN
+            elif isinstance(status, int) and status >= 500:
+                failures = self._failures[key] = self._failures.get(key, 0) + 1
+                if failures < FAILURE_THRESHOLD:
+                    return
+                seconds = min(MAX_COOLDOWN, FAILURE_COOLDOWN * 2 ** (failures - FAILURE_THRESHOLD))
+            else:
+                # Bad requests say nothing about the backend
+                return
+            self._cooldown_until[key] = max(self._cooldown_until.get(key, 0), time.time() + seconds)
+        metrics.inc("backend_cooldowns_total", model=model)
+        logger.warning(f"Taking {model} on one API key out of rotation for {seconds}s after: {str(error)}")
+
+_health = BackendHealth()
+
+def get_health():
+    return _health
+
+class Backend:
+    """One API key paired with one model name."""
+
+    def __init__(self, client, model_name, weight, label, generation_config=None):
+        self.client = client
+        self.model_name = model_name
+        self.weight = weight
+        self.label = label
+        self.generation_config = generation_config
+        self._model = None
+
+    @property
+    def api_key(self):
+        return self.client.api_key
+
+    def model(self):
+        if self._model is None:
+            self._model = self.client.generative_model(self.model_name, self.generation_config)
+        return self._model
+
+    def async_model(self):
+        # Bound to the running loop, so not kept
+        return self.client.async_generative_model(self.model_name, self.generation_config)
+
+class GeminiPool:
+    """Spread chunks over every combination of API keys and models.
+
+    Each chunk goes to a backend picked at random, weighted by the key's and
+    model's weights times how much of the backend's rate limit budget is left,
+    so traffic drifts towards the keys with the most room. Backends in a
+    cooldown after 429s or server errors are skipped while any other is
+    available. A chunk's upload and generation must use the same key, so the
+    backend is chosen once per chunk attempt.
+    """
+
+    def __init__(self, clients, models, generation_config=None, limiter=None, health=None):
+        """`clients` is a list of (client, weight) pairs, `models` maps model names to weights."""
+        if not clients or not models:
+            raise ValueError("A Gemini pool needs at least one API key and one model")
+        self.limiter = limiter or get_default_limiter()
+        self.health = health or get_health()
+        self.backends = [
+            Backend(client, model_name, key_weight * model_weight, f"key{i}", generation_config)
+            for i, (client, key_weight) in enumerate(clients, 1)
+            for model_name, model_weight in models.items()
+        ]
+        self.model_names = list(models)
+
+    def choose(self, estimated_tokens=0):
+        healthy = []
+        for backend in self.backends:
+            if self.health.cooldown(backend.api_key, backend.model_name):
+                continue
+            headroom = self.limiter.headroom(backend.api_key, backend.model_name, estimated_tokens)
+            healthy.append((backend, backend.weight * max(headroom, MIN_SHARE)))
+        if healthy:
+            backends, weights = zip(*healthy)
+            backend = random.choices(backends, weights=weights)[0]
+        else:
+            # Everything is cooling down; use whichever comes back first rather than stalling
+            backend = min(self.backends, key=lambda b: self.health.cooldown(b.api_key, b.model_name))
+        metrics.inc("backend_selected_total", backend=backend.label, model=backend.model_name)
+        return backend
+
+def get_pool(clients, models, generation_config=None):
+    """Return the shared pool for these clients and models, so backends keep their cached models."""
+    key = (tuple((id(client), weight) for client, weight in clients), tuple(models.items()), repr(generation_config))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = GeminiPool(clients, models, generation_config)
+            _pools[key] = pool
+        return pool
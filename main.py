@@ -1,10 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
 import os
-import tempfile
-from youtube_transcriber import process_youtube_url
+import threading
+import time
+import uuid
+from youtube_transcriber import process_youtube_url, canonical_url, JobCancelled, CAPTIONS_MODE
+from async_engine import get_default_engine
+from captions import CAPTION_MODES
+from gemini_client import get_client, preload
+from workspace import get_default_budget, remove_stale_workspaces
+import metrics
 import logging
 
 logging.basicConfig(
@@ -14,7 +26,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Constants
+ASYNC_ENGINE = True  # Run jobs as tasks on the server's event loop instead of on JOB_WORKERS threads
+JOB_WORKERS = 4  # Videos processed at the same time by the threaded engine, as far as the disk budget allows
+MAX_ACTIVE_JOBS = 20  # Queued + running jobs before new ones are rejected
+JOB_RETENTION = 60 * 60  # Seconds a finished job's result is kept around
+EVENT_POLL_INTERVAL = 0.25  # Seconds between checks for new job events
+ALLOW_SERVER_KEYS = os.getenv("ALLOW_SERVER_KEYS", "0") == "1"  # Let requests without an api_key run on the server's GEMINI_API_KEYS
+
+FINISHED_STATUSES = {"succeeded", "incomplete", "failed", "cancelled"}
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load the Gemini SDK in the background so the server answers health checks right away
+    threading.Thread(target=preload, name="preload", daemon=True).start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -25,42 +53,264 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+jobs = {}
+inflight = {}  # (video URL, captions mode, key ID) -> the unfinished job for it, shared by everyone asking
+jobs_lock = threading.Lock()
+
+# Workspaces from a previous server process that crashed mid-job
+remove_stale_workspaces()
+
 class TranscriptionRequest(BaseModel):
     url: str
-    api_key: str
+    api_key: str = ""
+    captions: str = CAPTIONS_MODE
 
-@app.post("/api/transcribe")
-async def transcribe_video(request: TranscriptionRequest):
+def key_id(api_key):
+    """Tell jobs on different API keys apart without keeping the keys themselves; None for the server's pool."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16] if api_key else None
+
+def job_view(job):
+    return {
+        "job_id": job["id"],
+        "url": job["url"],
+        "status": job["status"],
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"],
+        "transcript": job["transcript"],
+        "error": job["error"],
+        "subscribers": job["subscribers"],
+    }
+
+def release_inflight(job):
+    """Stop handing out a job to new requests once it has finished. Call with jobs_lock held."""
+    if inflight.get(job["key"]) is job:
+        del inflight[job["key"]]
+
+def add_event(job, event):
+    with jobs_lock:
+        job["events"].append(event)
+
+def finish_job(job, status, transcript=None, error=None):
+    with jobs_lock:
+        job["status"] = status
+        job["transcript"] = transcript
+        job["error"] = error
+        job["finished"] = time.time()
+        release_inflight(job)
+
+def prune_jobs():
+    cutoff = time.time() - JOB_RETENTION
+    with jobs_lock:
+        for job_id in [job_id for job_id, job in jobs.items() if job["finished"] and job["finished"] < cutoff]:
+            del jobs[job_id]
+
+def start_job(job):
+    """Mark a job as running, unless it was cancelled while it waited. Returns False if it shouldn't run."""
+    with jobs_lock:
+        if job["cancel_event"].is_set():
+            job["status"] = "cancelled"
+            job["finished"] = time.time()
+            release_inflight(job)
+            return False
+        job["status"] = "running"
+        job["started"] = time.time()
+    return True
+
+def finish_job_with_result(job, success, transcript_content):
+    if success:
+        finish_job(job, "succeeded", transcript=transcript_content)
+    elif transcript_content:
+        # Finished parts are cached, so submitting the video again only redoes the gaps
+        finish_job(
+            job, "incomplete", transcript=transcript_content,
+            error="Some parts could not be transcribed. Submit the video again to retry just those parts.",
+        )
+    else:
+        finish_job(job, "failed", error="Failed to process video")
+
+def run_job(job, request):
+    if not start_job(job):
+        return
+    try:
+        # Without a key of its own the job uses the server's pool (GEMINI_API_KEYS)
+        client = get_client(request.api_key) if request.api_key else None
+
+        # Downloads wait for room in the disk budget and get a workspace of their own
+        success, transcript_content = process_youtube_url(
+            job["url"],
+            cancel_event=job["cancel_event"],
+            on_progress=lambda event: add_event(job, event),
+            client=client,
+            captions_mode=request.captions,
+            disk_budget=get_default_budget(),
+        )
+        finish_job_with_result(job, success, transcript_content)
+
+    except JobCancelled:
+        finish_job(job, "cancelled")
+    except Exception as e:
+        logger.error(f"Job {job['id']} failed: {str(e)}")
+        finish_job(job, "failed", error=str(e))
+
+async def run_job_async(job, request):
+    if not start_job(job):
+        return
     try:
-        os.environ["GEMINI_API_KEY"] = request.api_key
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            os.environ["AUDIO_OUTPUT_DIR"] = temp_dir
-            success, transcript_content = process_youtube_url(request.url)
-            
-            if not success:
-                raise HTTPException(status_code=500, detail="Failed to process video")
-            
-            # Clean up audio files
-            audio_dir = "/tmp/audio"
-            if os.path.exists(audio_dir):
-                for file in os.listdir(audio_dir):
-                    file_path = os.path.join(audio_dir, file)
-                    try:
-                        if os.path.isfile(file_path):
-                            os.remove(file_path)
-                    except Exception as e:
-                        logger.error(f"Error deleting file {file_path}: {str(e)}")
-            
-            return JSONResponse({
-                "status": "success",
-                "message": "Video processed successfully",
-                "transcript": transcript_content
-            })
-            
+        # Without a key of its own the job uses the server's pool (GEMINI_API_KEYS)
+        client = get_client(request.api_key) if request.api_key else None
+        success, transcript_content = await get_default_engine().process_youtube_url(
+            job["url"],
+            cancel_event=job["cancel_event"],
+            on_progress=lambda event: add_event(job, event),
+            client=client,
+            captions_mode=request.captions,
+            disk_budget=get_default_budget(),
+        )
+        finish_job_with_result(job, success, transcript_content)
+
+    except JobCancelled:
+        finish_job(job, "cancelled")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Job {job['id']} failed: {str(e)}")
+        finish_job(job, "failed", error=str(e))
+
+@app.post("/api/transcribe", status_code=202)
+async def transcribe_video(request: TranscriptionRequest):
+    if request.captions not in CAPTION_MODES:
+        raise HTTPException(status_code=422, detail=f"captions must be one of {', '.join(CAPTION_MODES)}")
+    if not request.api_key and not ALLOW_SERVER_KEYS:
+        raise HTTPException(status_code=422, detail="api_key is required")
+    prune_jobs()
+    url = canonical_url(request.url)
+    # Each job bills the key it runs on, so only requests with the same key (or none) share one
+    key = (url, request.captions, key_id(request.api_key))
+    with jobs_lock:
+        # Requests for a video that is already being transcribed share that job and its result
+        job = inflight.get(key)
+        if job is not None and job["status"] != "cancelling":
+            job["subscribers"] += 1
+            metrics.inc("jobs_deduplicated_total")
+            logger.info(f"Joined job {job['id']} for {url} ({job['subscribers']} subscribers)")
+            return JSONResponse(job_view(job), status_code=202)
+
+        active = sum(1 for job in jobs.values() if job["status"] not in FINISHED_STATUSES)
+        if active >= MAX_ACTIVE_JOBS:
+            raise HTTPException(status_code=429, detail="Too many videos in progress, try again later")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "url": url,
+            "key": key,
+            "subscribers": 1,
+            "status": "queued",
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "transcript": None,
+            "error": None,
+            "events": [],
+            "cancel_event": threading.Event(),
+            "future": None,
+        }
+        jobs[job["id"]] = job
+        inflight[key] = job
+        if ASYNC_ENGINE:
+            job["future"] = asyncio.create_task(run_job_async(job, request))
+        else:
+            job["future"] = executor.submit(run_job, job, request)
+
+    logger.info(f"Queued job {job['id']} for {url}")
+    return JSONResponse(job_view(job), status_code=202)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job_view(job)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """Stream a job's progress as server-sent events, ending with a "finished" event.
+
+    Each event carries its index as the SSE id, so a reconnecting EventSource
+    resumes after the last event it received instead of starting over.
+    """
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    last_event_id = request.headers.get("last-event-id")
+    start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+
+    async def event_stream():
+        index = start
+        while True:
+            with jobs_lock:
+                events = job["events"][index:]
+                finished = job["status"] in FINISHED_STATUSES
+                status, error = job["status"], job["error"]
+            for event in events:
+                yield f"id: {index}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                index += 1
+            if finished:
+                data = json.dumps({"event": "finished", "status": status, "error": error})
+                yield f"id: {index}\nevent: finished\ndata: {data}\n\n"
+                return
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] in FINISHED_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+
+        if job["status"] == "cancelling":
+            return job_view(job)
+
+        # A shared job keeps running until everyone who asked for it has cancelled
+        job["subscribers"] -= 1
+        if job["subscribers"] > 0:
+            return job_view(job)
+
+        job["cancel_event"].set()
+        release_inflight(job)
+        # A task's cancel() also succeeds once it is running, so only use it on jobs that haven't started
+        if job["status"] == "queued" and job["future"].cancel():
+            # Never started, so nothing else will update it
+            job["status"] = "cancelled"
+            job["finished"] = time.time()
+        else:
+            # Running jobs stop at the next chunk boundary
+            job["status"] = "cancelling"
+        return job_view(job)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    with jobs_lock:
+        statuses = [job["status"] for job in jobs.values()]
+    for status in ("queued", "running", "cancelling", *sorted(FINISHED_STATUSES)):
+        metrics.set_gauge("jobs", statuses.count(status), status=status)
+    return PlainTextResponse(
+        metrics.get_metrics().render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"}
@@ -0,0 +1,66 @@
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class Manifest:
+    """Append-only JSONL log of what happened to each URL in a batch run.
+
+    Every state change is one line, flushed as soon as it is written, and the
+    last line for a URL wins when the file is loaded again. A run that crashes
+    can therefore be restarted with the same manifest and only redo the URLs
+    that never succeeded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.states = {}
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        line = "\n"
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave a half-written last line behind
+                        continue
+                    self.states[record["url"]] = record
+            logger.info(f"Loaded manifest with {len(self.states)} URLs: {path}")
+        self._file = open(path, 'a', encoding='utf-8')
+        if not line.endswith("\n"):
+            # End the half-written line, or the next record would be glued to it and lost
+            self._file.write("\n")
+
+    def status(self, url):
+        record = self.states.get(url)
+        return record["status"] if record else None
+
+    def pending(self, urls):
+        """URLs from `urls` that have not succeeded yet, in order and without duplicates."""
+        seen = set()
+        pending = []
+        for url in urls:
+            if url in seen or self.status(url) == "succeeded":
+                continue
+            seen.add(url)
+            pending.append(url)
+        return pending
+
+    def record(self, url, status, **extra):
+        record = {"url": url, "status": status, "time": time.time(), **extra}
+        with self._lock:
+            self.states[url] = record
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
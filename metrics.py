@@ -0,0 +1,152 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Constants
+METRIC_PREFIX = "y2t_"
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)  # Seconds, for stage histograms
+
+HELP = {
+    "stage_duration_seconds": "Time spent in each pipeline stage",
+    "stage_errors_total": "Stage runs that ended in an exception",
+    "retries_total": "Calls retried after a failure",
+    "rate_limited_total": "Calls rejected with a 429",
+    "cache_requests_total": "Transcript cache lookups by kind and result",
+    "uploaded_bytes_total": "Audio bytes uploaded to Gemini",
+    "upload_reuses_total": "Chunks that reused a file uploaded earlier instead of uploading again",
+    "remote_files_deleted_total": "Uploaded files deleted after their transcript was stored",
+    "tokens_total": "Gemini tokens used, from response usage metadata",
+    "videos_total": "Videos finished, by result",
+    "queue_depth": "Items waiting in each queue",
+    "backend_selected_total": "Chunks sent to each API key and model in the pool",
+    "backend_cooldowns_total": "Times an API key and model was taken out of rotation after errors",
+    "jobs": "API jobs by status",
+    "jobs_deduplicated_total": "Transcription requests that joined a job already in progress for the same video",
+}
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metrics:
+    """Thread-safe counters, gauges and stage duration histograms for one process."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._durations = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            entry = self._durations.get(stage)
+            if entry is None:
+                entry = self._durations[stage] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(self.buckets)}
+            entry["count"] += 1
+            entry["sum"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry["buckets"][i] += 1
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """Time the block as one run of `stage`, counting it as an error if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("stage_errors_total", stage=stage)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe(stage, seconds)
+            details = "".join(f" {name}={value}" for name, value in fields.items())
+            logger.debug(f"span stage={stage} seconds={seconds:.3f}{details}")
+
+    def summary(self):
+        """Return everything recorded so far as a JSON-friendly dict."""
+        with self._lock:
+            counters = {}
+            for (name, key), value in sorted(self._counters.items()):
+                counters.setdefault(name, {})[",".join(f"{k}={v}" for k, v in key) or "total"] = value
+            gauges = {}
+            for (name, key), value in sorted(self._gauges.items()):
+                gauges.setdefault(name, {})[",".join(f"{k}={v}" for k, v in key) or "value"] = value
+            stages = {
+                stage: {
+                    "count": entry["count"],
+                    "total_seconds": round(entry["sum"], 3),
+                    "mean_seconds": round(entry["sum"] / entry["count"], 3),
+                    "max_seconds": round(entry["max"], 3),
+                }
+                for stage, entry in sorted(self._durations.items())
+            }
+        return {"stages": stages, "counters": counters, "gauges": gauges}
+
+    def render_prometheus(self):
+        """Return everything recorded so far in the Prometheus text exposition format."""
+        lines = []
+        def header(name, kind):
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        with self._lock:
+            if self._durations:
+                header("stage_duration_seconds", "histogram")
+                name = f"{METRIC_PREFIX}stage_duration_seconds"
+                for stage, entry in sorted(self._durations.items()):
+                    key = (("stage", stage),)
+                    for bound, count in zip(self.buckets, entry["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {entry['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {entry['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {entry['count']}")
+
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                seen = set()
+                for (name, key), value in sorted(values.items()):
+                    if name not in seen:
+                        header(name, kind)
+                        seen.add(name)
+                    lines.append(f"{METRIC_PREFIX}{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+_default_metrics = Metrics()
+
+def get_metrics():
+    return _default_metrics
+
+def span(stage, **fields):
+    return _default_metrics.span(stage, **fields)
+
+def inc(name, amount=1, **labels):
+    _default_metrics.inc(name, amount, **labels)
+
+def set_gauge(name, value, **labels):
+    _default_metrics.set_gauge(name, value, **labels)
+
+def count_retry(call):
+    """Return a tenacity before_sleep hook that counts retries of `call`."""
+    def before_sleep(retry_state):
+        inc("retries_total", call=call)
+    return before_sleep
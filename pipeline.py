@@ -0,0 +1,234 @@
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import youtube_transcriber as yt
+import metrics
+from transcript_cache import get_default_cache
+from workspace import Workspace, get_default_budget
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DOWNLOAD_WORKERS = 4  # yt-dlp downloads running at once (network bound)
+SPLIT_WORKERS = max(1, min(4, os.cpu_count() or 1))  # Videos being cut by ffmpeg at once (CPU/disk bound)
+TRANSCRIBE_WORKERS = 8  # Chunks in flight to Gemini across all videos (API bound)
+STAGE_QUEUE_SIZE = 4  # Items waiting between stages before the earlier stage blocks
+
+_DONE = object()
+
+class Pipeline:
+    """Download, split and transcribe videos in three overlapping stages.
+
+    Each stage has its own threads sized for the resource it uses: yt-dlp
+    downloads, ffmpeg runs (each a process of its own) and Gemini calls. The
+    stages are connected by bounded queues, so a slow stage makes the earlier
+    ones wait instead of piling up audio on disk. A video's chunks are queued
+    for transcription as ffmpeg cuts them, and transcription works on single
+    chunks, so chunks from different videos share the same API workers.
+
+    Every downloaded video gets its own workspace, reserved from the disk budget
+    before the download starts and deleted once its last chunk is done.
+
+    `client` may be a single client or a GeminiPool to spread chunks over.
+    `on_result(url, success, transcript, error)` is called once per URL from
+    whichever worker finishes it.
+    """
+
+    def __init__(self, client, cache=None, on_result=None,
+                 download_workers=DOWNLOAD_WORKERS, split_workers=SPLIT_WORKERS,
+                 transcribe_workers=TRANSCRIBE_WORKERS, queue_size=STAGE_QUEUE_SIZE,
+                 captions_mode=yt.CAPTIONS_MODE, disk_budget=None):
+        self.pool = yt.resolve_pool(client)
+        self.cache = cache if cache is not None else get_default_cache()
+        self.on_result = on_result
+        self.download_workers = download_workers
+        self.split_workers = split_workers
+        self.transcribe_workers = transcribe_workers
+        self.captions_mode = captions_mode
+        self.disk_budget = disk_budget if disk_budget is not None else get_default_budget()
+
+        self.url_queue = queue.Queue()
+        self.split_queue = queue.Queue(maxsize=queue_size)
+        self.chunk_queue = queue.Queue(maxsize=max(queue_size, transcribe_workers))
+
+    def run(self, urls):
+        for url in urls:
+            self.url_queue.put(url)
+
+        with ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="roster") as roster_pool:
+            self.roster_pool = roster_pool
+            downloaders = self._start(self._download_worker, self.download_workers, "download")
+            splitters = self._start(self._split_worker, self.split_workers, "split")
+            transcribers = self._start(self._transcribe_worker, self.transcribe_workers, "transcribe")
+
+            # Shut the stages down in order once each one has drained
+            self._stop(self.url_queue, downloaders)
+            self._stop(self.split_queue, splitters)
+            self._stop(self.chunk_queue, transcribers)
+
+    def _start(self, target, count, name):
+        threads = [
+            threading.Thread(target=target, name=f"{name}-{i}", daemon=True)
+            for i in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _stop(self, stage_queue, threads):
+        for _ in threads:
+            stage_queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    def _track_queues(self):
+        metrics.set_gauge("queue_depth", self.url_queue.qsize(), queue="download")
+        metrics.set_gauge("queue_depth", self.split_queue.qsize(), queue="split")
+        metrics.set_gauge("queue_depth", self.chunk_queue.qsize(), queue="transcribe")
+
+    def _report(self, url, success, transcript=None, error=None):
+        metrics.inc("videos_total", result="succeeded" if success else "failed")
+        if success:
+            logger.info(f"Successfully processed: {url}")
+        else:
+            logger.error(f"Failed to process {url}: {error}")
+        if self.on_result is not None:
+            try:
+                self.on_result(url, success, transcript, error)
+            except Exception as e:
+                logger.error(f"Result callback failed for {url}: {str(e)}")
+
+    def _download_worker(self):
+        while True:
+            url = self.url_queue.get()
+            if url is _DONE:
+                return
+            self._track_queues()
+            try:
+                video_id, transcript = yt.transcribe_without_audio(url, self.cache, self.pool, self.captions_mode)
+                if transcript is not None:
+                    self._report(url, True, transcript)
+                    continue
+            except Exception as e:
+                self._report(url, False, error=str(e))
+                continue
+
+            workspace = Workspace(self.disk_budget)
+            try:
+                # Blocks while other videos hold the disk budget
+                workspace.open()
+                audio_path, metadata = yt.download_audio(url, workspace.path)
+                video = {
+                    "url": url,
+                    "workspace": workspace,
+                    "audio_path": audio_path,
+                    "title": metadata["title"],
+                    "video_id": metadata["id"] or video_id,
+                    "duration": metadata["duration"],
+                    "entry_log": yt.open_entry_log(audio_path, metadata["title"], metadata["id"] or video_id),
+                    # Fetched while the video waits for the split stage; its first chunk waits for it
+                    "roster_future": self.roster_pool.submit(yt.get_speaker_roster, self.pool, metadata, self.cache),
+                    "lock": threading.Lock(),
+                    "errors": {},
+                }
+            except Exception as e:
+                # Closing a workspace that never opened is a no-op
+                workspace.close()
+                self._report(url, False, error=str(e))
+                continue
+            # Blocks while the split stage is busy
+            self.split_queue.put(video)
+
+    def _split_worker(self):
+        while True:
+            video = self.split_queue.get()
+            if video is _DONE:
+                return
+            self._track_queues()
+            self._split(video)
+
+    def _split(self, video):
+        """Cut a video into chunks, queuing each one for transcription as soon as ffmpeg has written it."""
+        audio_path = video["audio_path"]
+        video.update(transcripts={}, queued=0, remaining=0, split_done=False, split_error=None)
+        chunks = []
+        try:
+            split = yt.plan_split(audio_path, video["video_id"], self.cache, video["duration"])
+            total_parts = split["total_parts"]
+            # ffmpeg is a process of its own, so a thread is enough to drive it. Includes time
+            # spent waiting for room in the transcription queue
+            with metrics.span("split"):
+                for i, chunk in enumerate(split["chunks"], 1):
+                    chunks.append(chunk)
+                    if i == 1:
+                        video["roster"] = video["roster_future"].result()
+                    with video["lock"]:
+                        video["queued"] = i
+                        video["remaining"] += 1
+                    # Blocks while the transcription stage is busy
+                    self.chunk_queue.put((video, i, max(total_parts, i), chunk))
+            if split["plan"] is None:
+                yt.save_chunk_plan(self.cache, video["video_id"], chunks, video.get("roster", ""))
+        except Exception as e:
+            video["split_error"] = str(e)
+        finally:
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+
+        with video["lock"]:
+            video["split_done"] = True
+            if video["remaining"]:
+                return
+        self._finish_video(video)
+
+    def _transcribe_worker(self):
+        while True:
+            item = self.chunk_queue.get()
+            if item is _DONE:
+                return
+            self._track_queues()
+            video, part, total_parts, chunk = item
+            transcript = error = None
+            try:
+                transcript = yt.transcribe_chunk_with_retries(
+                    self.pool, chunk, part, total_parts, video["video_id"], self.cache,
+                    roster=video["roster"], entry_log=video["entry_log"],
+                )
+            except Exception as e:
+                error = yt.describe_error(e)
+                logger.error(f"Giving up on chunk {part}/{total_parts} of {video['url']}: {error}")
+            if os.path.exists(chunk["path"]):
+                os.remove(chunk["path"])
+            self._finish_chunk(video, part, transcript, error)
+
+    def _finish_chunk(self, video, part, transcript, error):
+        with video["lock"]:
+            video["transcripts"][part - 1] = transcript
+            if error is not None:
+                video["errors"][part - 1] = error
+            video["remaining"] -= 1
+            # Whichever of the split and the last chunk finishes second completes the video
+            if video["remaining"] or not video["split_done"]:
+                return
+        self._finish_video(video)
+
+    def _finish_video(self, video):
+        # A failed chunk leaves a gap marker; the finished ones are cached for the next run
+        try:
+            if video["split_error"] is not None:
+                self._report(video["url"], False, error=video["split_error"])
+            elif not video["queued"]:
+                self._report(video["url"], False, error="No audio found")
+            else:
+                combined = yt.finish_transcript(
+                    [video["transcripts"].get(i) for i in range(video["queued"])],
+                    video["audio_path"], video["title"], video["video_id"], self.cache,
+                    errors=video["errors"], entry_log=video["entry_log"],
+                )
+                self._report(video["url"], True, combined)
+        except Exception as e:
+            self._report(video["url"], False, error=str(e))
+        finally:
+            video["workspace"].close()
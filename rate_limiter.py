@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Constants
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_RPM", "108"))  # Same 1.8 calls/second budget as before
+TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TPM", "1000000"))
+RATE_LIMIT_PATH = os.getenv(
+    "RATE_LIMIT_PATH",
+    os.path.join(tempfile.gettempdir(), "youtube2transcripts-ratelimit.sqlite3"),
+)
+AUDIO_TOKENS_PER_SECOND = 32  # Gemini counts audio input at 32 tokens per second
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+def is_rate_limit_error(error):
+    """True for 429 responses from either the generative API or the upload API."""
+    # Imported here so the limiter doesn't pull in google.api_core at startup
+    from google.api_core import exceptions as api_exceptions
+    if isinstance(error, api_exceptions.TooManyRequests):
+        return True
+    response = getattr(error, "resp", None)
+    return getattr(response, "status", None) == 429
+
+class RateLimiter:
+    """Token buckets for requests/minute and tokens/minute, one pair per API key and model.
+
+    Bucket state lives in a SQLite file and every update runs in an immediate
+    transaction, so all threads and processes pointing at the same file share
+    one budget. API keys are hashed before they are written to disk.
+    """
+
+    def __init__(self, path=RATE_LIMIT_PATH, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.path = path
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY,"
+                " requests REAL NOT NULL,"
+                " tokens REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so concurrent processes serialize here
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def bucket_key(self, api_key, model):
+        return f"{hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]}:{model}"
+
+    def _load(self, conn, key, now):
+        row = conn.execute("SELECT requests, tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return float(self.requests_per_minute), float(self.tokens_per_minute)
+        return self._load_row(row, now)
+
+    def _load_row(self, row, now):
+        requests, tokens, updated = row
+        elapsed = max(0.0, now - updated)
+        requests = min(self.requests_per_minute, requests + elapsed * self.requests_per_minute / 60)
+        tokens = min(self.tokens_per_minute, tokens + elapsed * self.tokens_per_minute / 60)
+        return requests, tokens
+
+    def _store(self, conn, key, requests, tokens, now):
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (key, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+            (key, requests, tokens, now),
+        )
+
+    def try_acquire(self, api_key, model, tokens=0):
+        """Take one request and `tokens` tokens if both are available.
+
+        Returns 0 on success, otherwise the number of seconds to wait before trying again.
+        """
+        key = self.bucket_key(api_key, model)
+        # A single call larger than the whole minute budget must still get through eventually
+        tokens = min(tokens, self.tokens_per_minute)
+        now = time.time()
+        with self._transaction() as conn:
+            available_requests, available_tokens = self._load(conn, key, now)
+            if available_requests >= 1 and available_tokens >= tokens:
+                self._store(conn, key, available_requests - 1, available_tokens - tokens, now)
+                return 0
+            self._store(conn, key, available_requests, available_tokens, now)
+
+        wait = 0.0
+        if available_requests < 1:
+            wait = (1 - available_requests) * 60 / self.requests_per_minute
+        if available_tokens < tokens:
+            wait = max(wait, (tokens - available_tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, api_key, model, tokens=0):
+        """Block until a request with `tokens` tokens fits in the budget for this key and model."""
+        while True:
+            wait = self.try_acquire(api_key, model, tokens)
+            if not wait:
+                return
+            logger.debug(f"Rate limit reached for {model}, waiting {wait:.2f}s")
+            time.sleep(wait)
+
+    async def acquire_async(self, api_key, model, tokens=0, run_blocking=None):
+        """Like acquire, but waits on the event loop, so waiting calls don't each hold a thread.
+
+        The SQLite transaction can wait on other processes, so it runs through
+        `run_blocking` (an engine's run_blocking), or asyncio.to_thread without one.
+        """
+        run_blocking = run_blocking or asyncio.to_thread
+        while True:
+            wait = await run_blocking(self.try_acquire, api_key, model, tokens)
+            if not wait:
+                return
+            logger.debug(f"Rate limit reached for {model}, waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    def headroom(self, api_key, model, tokens=0):
+        """Share of the budget left for this key and model, from 0 to 1, counting a call of `tokens` tokens.
+
+        Read without locking, so it is only an estimate for choosing between keys.
+        """
+        key = self.bucket_key(api_key, model)
+        row = self._connection().execute("SELECT requests, tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return 1.0
+        available_requests, available_tokens = self._load_row(row, time.time())
+        tokens = min(tokens, self.tokens_per_minute)
+        return max(0.0, min(available_requests / self.requests_per_minute, (available_tokens - tokens) / self.tokens_per_minute))
+
+    def adjust(self, api_key, model, tokens):
+        """Correct the token bucket once the real usage of a call is known (negative refunds)."""
+        key = self.bucket_key(api_key, model)
+        now = time.time()
+        with self._transaction() as conn:
+            available_requests, available_tokens = self._load(conn, key, now)
+            self._store(conn, key, available_requests, available_tokens - tokens, now)
+
+    def penalize(self, api_key, model, seconds):
+        """Drain the request bucket after a 429 so every worker backs off together."""
+        key = self.bucket_key(api_key, model)
+        now = time.time()
+        with self._transaction() as conn:
+            _, available_tokens = self._load(conn, key, now)
+            self._store(conn, key, -seconds * self.requests_per_minute / 60, available_tokens, now)
+        logger.warning(f"Got rate limited on {model}, pausing requests for {seconds}s")
+
+def get_default_limiter():
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
@@ -1,7 +1,29 @@
 import subprocess
 import sys
+import time
+import urllib.request
 import webbrowser
-from time import sleep
+
+# Constants
+BACKEND_HEALTH_URL = "http://127.0.0.1:3000/api/health"
+FRONTEND_URL = "http://localhost:8000"
+READY_TIMEOUT = 30  # Seconds to wait for the servers to come up
+READY_POLL_INTERVAL = 0.1
+
+def wait_until_ready(url, process, timeout=READY_TIMEOUT):
+    """Poll `url` until it answers, returning False if `process` exits or the timeout passes first."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status < 500:
+                    return True
+        except OSError:
+            pass
+        time.sleep(READY_POLL_INTERVAL)
+    return False
 
 def main():
     # Start backend server
@@ -10,13 +32,18 @@ def main():
     # Start frontend server
     frontend = subprocess.Popen([sys.executable, "-m", "http.server", "8000"])
     
-    # Wait a moment for servers to start
-    sleep(2)
-    
-    # Open browser
-    webbrowser.open('http://localhost:8000')
-    
     try:
+        # Open the page as soon as both servers answer, instead of after a fixed delay
+        for name, url, process in (("Backend", BACKEND_HEALTH_URL, backend), ("Frontend", FRONTEND_URL, frontend)):
+            if not wait_until_ready(url, process):
+                print(f"{name} server did not start", file=sys.stderr)
+                backend.terminate()
+                frontend.terminate()
+                return 1
+        
+        # Open browser
+        webbrowser.open(FRONTEND_URL)
+        
         # Keep the script running
         backend.wait()
         frontend.wait()
@@ -27,4 +54,4 @@ def main():
         print("\nServers stopped")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+
+# Schema the model fills in structured mode: one entry per speaker turn, times relative to the chunk
+TRANSCRIPT_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "speaker": {"type": "string", "description": "Name of the speaker"},
+            "text": {"type": "string", "description": "What the speaker said in this turn"},
+            "start": {"type": "string", "description": "When the turn starts, as MM:SS from the start of the audio"},
+            "end": {"type": "string", "description": "When the turn ends, as MM:SS from the start of the audio"},
+        },
+        "required": ["speaker", "text", "start", "end"],
+    },
+}
+TIMESTAMP_PATTERN = re.compile(r"^(?:(\d+):)?(?:(\d+):)?(\d+(?:[.,]\d+)?)$")
+
+def parse_timestamp(value):
+    """Return "HH:MM:SS", "MM:SS", "SS.mmm" or a number as seconds, or None if it isn't a time."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = TIMESTAMP_PATTERN.match(str(value or "").strip())
+    if not match:
+        return None
+    first, second, seconds = match.groups()
+    hours, minutes = (first, second) if second is not None else (None, first)
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds.replace(",", "."))
+
+def _load_items(text):
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # A response cut off at the output limit still holds every entry before the cut
+        data = []
+        decoder = json.JSONDecoder()
+        index = text.find("{")
+        while index != -1:
+            try:
+                item, end = decoder.raw_decode(text, index)
+            except ValueError:
+                break
+            data.append(item)
+            index = text.find("{", end)
+    return data if isinstance(data, list) else [data]
+
+def parse_entries(text, duration=None):
+    """Turn a structured response into entries {speaker, text, start, end} with times in seconds from the chunk start.
+
+    Missing or unreadable times are taken from the neighbouring entries, and
+    times are kept in order and within `duration` when it is known.
+    """
+    entries = []
+    previous_end = 0.0
+    for item in _load_items(text):
+        if not isinstance(item, dict) or not str(item.get("text") or "").strip():
+            continue
+        start = parse_timestamp(item.get("start"))
+        end = parse_timestamp(item.get("end"))
+        start = previous_end if start is None else max(start, entries[-1]["start"] if entries else 0.0)
+        if duration:
+            start = min(start, duration)
+        end = start if end is None or end < start else (min(end, duration) if duration else end)
+        entries.append({
+            "speaker": str(item.get("speaker") or "").strip() or "Unknown",
+            "text": str(item["text"]).strip(),
+            "start": start,
+            "end": end,
+        })
+        previous_end = end
+    return entries
+
+def shift_entries(entries, offset, skip_before=0.0):
+    """Move chunk-relative entries to the video's timeline, dropping the ones that start in the first `skip_before` seconds.
+
+    Those belong to audio repeated from the previous chunk (CHUNK_OVERLAP), which
+    already has them.
+    """
+    return [
+        {**entry, "start": round(entry["start"] + offset, 3), "end": round(entry["end"] + offset, 3)}
+        for entry in entries
+        if entry["start"] >= skip_before
+    ]
+
+def render_markdown(entries):
+    """Render entries as "**Name:** text" paragraphs, joining consecutive turns of the same speaker."""
+    paragraphs = []
+    speaker = None
+    for entry in entries:
+        if entry["speaker"] == speaker:
+            paragraphs[-1] += " " + entry["text"]
+        else:
+            speaker = entry["speaker"]
+            paragraphs.append(f"**{speaker}:** {entry['text']}")
+    return "\n\n".join(paragraphs)
+
+def _subtitle_time(seconds, separator):
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+def render_srt(entries):
+    cues = []
+    for i, entry in enumerate(entries, 1):
+        timing = f"{_subtitle_time(entry['start'], ',')} --> {_subtitle_time(entry['end'], ',')}"
+        cues.append(f"{i}\n{timing}\n{entry['speaker']}: {entry['text']}")
+    return "\n\n".join(cues) + "\n"
+
+def render_vtt(entries):
+    cues = ["WEBVTT"]
+    for entry in entries:
+        timing = f"{_subtitle_time(entry['start'], '.')} --> {_subtitle_time(entry['end'], '.')}"
+        # Voice tags keep the speaker out of the text and let players style them
+        speaker = entry["speaker"].replace(">", "")
+        cues.append(f"{timing}\n<v {speaker}>{entry['text']}")
+    return "\n\n".join(cues) + "\n"
+
+RENDERERS = {
+    "md": render_markdown,
+    "srt": render_srt,
+    "vtt": render_vtt,
+}
+
+def read_entries(path):
+    """Read a transcript's JSONL file and return its entries in time order."""
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return sorted(entries, key=lambda entry: (entry["start"], entry.get("part", 0)))
+
+def write_entries(path, entries, video_id=None):
+    """Write a whole transcript's entries to a JSONL file at once, e.g. when it comes from the cache."""
+    log = EntryLog(path, video_id)
+    log.append(None, entries)
+
+def write_renderings(path, entries, formats=("srt", "vtt")):
+    """Render the entries next to `path` (the transcript without its extension) in each format; returns the paths."""
+    paths = []
+    for name in formats:
+        output_path = f"{path}.{name}"
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(RENDERERS[name](entries))
+        paths.append(output_path)
+    return paths
+
+class EntryLog:
+    """A transcript's JSONL file, appended to as each chunk finishes.
+
+    Chunks finish in any order, so lines are in completion order; every line
+    has its part number and times on the video's timeline, and read_entries
+    sorts them. Opening the log empties any file left by an earlier attempt.
+    """
+
+    def __init__(self, path, video_id=None):
+        self.path = path
+        self.video_id = video_id
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        open(path, 'w', encoding='utf-8').close()
+
+    def append(self, part, entries):
+        lines = "".join(
+            json.dumps({"video_id": self.video_id, "part": part, **entry}, ensure_ascii=False) + "\n"
+            for entry in entries
+        )
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            # Readers tail this file, so don't leave a chunk's lines in the buffer
+            f.flush()
+
+    def read(self):
+        with self._lock:
+            return read_entries(self.path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a structured transcript (JSONL) as markdown, SRT or WebVTT.")
+    parser.add_argument("path", help="transcript .jsonl file")
+    parser.add_argument("--format", choices=sorted(RENDERERS), default="md", help="output format (default: md)")
+    args = parser.parse_args(argv)
+    sys.stdout.write(RENDERERS[args.format](read_entries(args.path)))
+
+if __name__ == "__main__":
+    main()
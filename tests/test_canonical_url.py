@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from youtube_transcriber import canonical_url, extract_video_id
+
+WATCH_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s",
+    "https://www.youtube.com/watch?feature=share&v=dQw4w9WgXcQ",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&list=PL1234567890",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ?start=10",
+    "https://www.youtube.com/live/dQw4w9WgXcQ",
+    "  https://youtu.be/dQw4w9WgXcQ\n",
+])
+def test_links_to_one_video_share_a_url(url):
+    assert canonical_url(url) == WATCH_URL
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/playlist?list=PL1234567890",
+    "https://www.youtube.com/@channel",
+    "https://example.com/video",
+])
+def test_other_urls_are_unchanged(url):
+    assert canonical_url(url) == url
+
+def test_ids_must_be_exactly_eleven_characters():
+    assert extract_video_id("https://youtu.be/dQw4w9WgXcQX") is None
+    assert extract_video_id("https://youtu.be/dQw4w9") is None
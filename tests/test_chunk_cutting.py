@@ -0,0 +1,45 @@
+import os
+import sys
+import shutil
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import youtube_transcriber as yt
+from transcript_cache import hash_file
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+@pytest.fixture
+def opus_source(tmp_path):
+    # The usual YouTube bestaudio: Opus in WebM, whose chunks are copied into Ogg
+    path = str(tmp_path / "source.webm")
+    subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+         "-f", "lavfi", "-i", "sine=frequency=220:duration=30", "-c:a", "libopus", path],
+        check=True,
+    )
+    return path
+
+@pytest.mark.parametrize("speech_optimize", [False, True])
+def test_cutting_the_same_span_twice_gives_the_same_hash(opus_source, speech_optimize):
+    ext, codec_args = yt.chunk_format(opus_source, speech_optimize)
+    assert ext == ".ogg"
+    hashes = []
+    for i in range(2):
+        chunk_path = f"{opus_source}_cut_{i}{ext}"
+        yt.cut_audio(opus_source, 5.0, 20.0, chunk_path, codec_args)
+        hashes.append(hash_file(chunk_path))
+    assert hashes[0] == hashes[1]
+
+def test_segmenting_twice_gives_the_same_hashes(opus_source):
+    runs = []
+    for _ in range(2):
+        paths = list(yt.iter_audio_chunks(opus_source, 10))
+        runs.append([hash_file(path) for path in paths])
+        for path in paths:
+            os.remove(path)
+    assert len(runs[0]) > 1
+    assert runs[0] == runs[1]
@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunk_planner import iter_chunk_spans, split_span, MIN_CHUNK_DURATION, SILENCE_SEARCH_WINDOW
+
+def pauses_every(seconds, duration):
+    return [(t + seconds - 1, t + seconds) for t in range(0, duration, seconds)]
+
+def test_short_tail_joins_the_last_chunk():
+    spans = list(iter_chunk_spans(3600, 1200, iter(pauses_every(7, 3600))))
+    assert len(spans) == 3
+    assert spans[-1][1] == 3600
+    assert all(end - start >= MIN_CHUNK_DURATION for start, end, _ in spans)
+
+def test_long_tail_keeps_its_own_chunk():
+    spans = list(iter_chunk_spans(3800, 1200, iter(pauses_every(7, 3800))))
+    assert len(spans) == 4
+    assert spans[-1][1] - spans[-1][0] >= MIN_CHUNK_DURATION
+
+def test_split_span_always_gives_two_halves():
+    duration = 2 * MIN_CHUNK_DURATION + SILENCE_SEARCH_WINDOW
+    halves = split_span(duration, [])
+    assert [(start, end) for start, end, _ in halves] == [(0.0, duration / 2), (duration / 2, duration)]
+
+def test_split_span_cuts_at_the_longest_pause_near_the_middle():
+    halves = split_span(600, [(100, 105), (280, 281), (310, 313), (500, 510)])
+    assert halves[0][1] == halves[1][0] == 311.5
+    assert halves[0][2] == 311.5 - 5 - 1 - 1.5
+
+def test_short_tail_over_the_speech_budget_keeps_its_own_chunk():
+    spans = list(iter_chunk_spans(1800, 2400, iter(pauses_every(7, 1800)), speech_budget=1500))
+    assert len(spans) == 2
+    assert spans[-1][1] - spans[-1][0] < MIN_CHUNK_DURATION
+    assert all(speech <= 1500 for _, _, speech in spans)
+
+def test_short_tail_within_the_speech_budget_joins_the_last_chunk():
+    spans = list(iter_chunk_spans(1250, 1200, iter([]), speech_budget=2000))
+    assert spans == [(0.0, 1250, 1250.0)]
+    assert spans[-1][1] - spans[-1][0] <= 1200 + MIN_CHUNK_DURATION
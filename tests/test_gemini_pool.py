@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import random
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_pool
+from gemini_pool import BackendHealth, GeminiPool, parse_weighted
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gemini_pool, "time", SimpleNamespace(time=clock, sleep=time.sleep))
+    return clock
+
+class FakeLimiter:
+    def __init__(self, headroom=None):
+        self.room = headroom or {}
+
+    def headroom(self, api_key, model, tokens=0):
+        return self.room.get((api_key, model), 1.0)
+
+def make_pool(keys, models, limiter=None, health=None):
+    clients = [(SimpleNamespace(api_key=key), weight) for key, weight in keys]
+    return GeminiPool(clients, models, limiter=limiter or FakeLimiter(), health=health or BackendHealth())
+
+def server_error():
+    return api_exceptions.InternalServerError("boom")
+
+def test_parse_weighted():
+    assert parse_weighted("a, b:3,,c:0.5") == {"a": 1.0, "b": 3.0, "c": 0.5}
+
+def test_choose_follows_weights_and_headroom(monkeypatch):
+    limiter = FakeLimiter({("full", "m"): 0.0})
+    pool = make_pool([("a", 1), ("b", 3), ("full", 1)], {"m": 1}, limiter)
+    random.seed(1)
+    picks = [pool.choose().api_key for _ in range(2000)]
+    # Weights 1 : 3 : MIN_SHARE for the key with an empty bucket
+    assert picks.count("b") > 2.5 * picks.count("a")
+    assert 0 < picks.count("full") < picks.count("a") / 5
+
+def test_rate_limit_error_cools_the_backend_down(clock):
+    health = BackendHealth()
+    health.record_failure("key", "m", api_exceptions.TooManyRequests("slow down"))
+    assert health.cooldown("key", "m") == gemini_pool.RATE_LIMIT_COOLDOWN
+    assert health.cooldown("key", "other") == 0
+    clock.now += gemini_pool.RATE_LIMIT_COOLDOWN
+    assert health.cooldown("key", "m") == 0
+
+def test_server_errors_cool_down_after_the_threshold_and_double(clock):
+    health = BackendHealth()
+    for _ in range(gemini_pool.FAILURE_THRESHOLD - 1):
+        health.record_failure("key", "m", server_error())
+    assert health.cooldown("key", "m") == 0
+    health.record_failure("key", "m", server_error())
+    assert health.cooldown("key", "m") == gemini_pool.FAILURE_COOLDOWN
+    health.record_failure("key", "m", server_error())
+    assert health.cooldown("key", "m") == 2 * gemini_pool.FAILURE_COOLDOWN
+
+def test_success_clears_the_error_count(clock):
+    health = BackendHealth()
+    for _ in range(gemini_pool.FAILURE_THRESHOLD - 1):
+        health.record_failure("key", "m", server_error())
+    health.record_success("key", "m")
+    health.record_failure("key", "m", server_error())
+    assert health.cooldown("key", "m") == 0
+
+def test_bad_requests_leave_the_backend_alone(clock):
+    health = BackendHealth()
+    for _ in range(5):
+        health.record_failure("key", "m", api_exceptions.BadRequest("bad"))
+    assert health.cooldown("key", "m") == 0
+
+def test_choose_skips_backends_cooling_down(clock):
+    health = BackendHealth()
+    pool = make_pool([("a", 1), ("b", 1)], {"m": 1}, health=health)
+    health.record_failure("a", "m", api_exceptions.TooManyRequests("slow down"))
+    assert {pool.choose().api_key for _ in range(50)} == {"b"}
+
+def test_choose_falls_back_to_the_first_backend_back_when_all_cool_down(clock):
+    health = BackendHealth()
+    pool = make_pool([("a", 1), ("b", 1)], {"m": 1}, health=health)
+    health.record_failure("a", "m", api_exceptions.Forbidden("revoked"))
+    health.record_failure("b", "m", api_exceptions.TooManyRequests("slow down"))
+    assert pool.choose().api_key == "b"
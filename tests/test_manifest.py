@@ -0,0 +1,47 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from manifest import Manifest
+
+URLS = [f"https://www.youtube.com/watch?v=video{i:06d}" for i in range(3)]
+
+def test_resumed_run_only_redoes_urls_that_did_not_succeed(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = Manifest(path)
+    manifest.record(URLS[0], "succeeded")
+    manifest.record(URLS[1], "failed", error="Failed to process video")
+    manifest.close()
+
+    resumed = Manifest(path)
+    assert resumed.status(URLS[0]) == "succeeded"
+    assert resumed.status(URLS[1]) == "failed"
+    assert resumed.pending(URLS) == URLS[1:]
+
+def test_last_record_for_a_url_wins(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = Manifest(path)
+    manifest.record(URLS[0], "failed")
+    manifest.record(URLS[0], "succeeded")
+    manifest.close()
+    assert Manifest(path).pending(URLS) == URLS[1:]
+
+def test_half_written_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = Manifest(path)
+    manifest.record(URLS[0], "succeeded")
+    manifest.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"url": "' + URLS[1])
+
+    resumed = Manifest(path)
+    assert resumed.status(URLS[1]) is None
+    assert resumed.pending(URLS) == URLS[1:]
+    resumed.record(URLS[1], "succeeded")
+    resumed.close()
+    assert Manifest(path).pending(URLS) == URLS[2:]
+
+def test_pending_drops_duplicates_and_keeps_order(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.jsonl"))
+    assert manifest.pending([URLS[2], URLS[0], URLS[2]]) == [URLS[2], URLS[0]]
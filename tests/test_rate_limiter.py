@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rate_limiter
+from rate_limiter import RateLimiter
+
+def test_acquire_async_runs_the_transaction_through_run_blocking(tmp_path):
+    limiter = RateLimiter(str(tmp_path / "ratelimit.sqlite3"), requests_per_minute=60, tokens_per_minute=1000)
+    calls = []
+
+    async def run_blocking(function, *args):
+        calls.append(function.__name__)
+        return function(*args)
+
+    asyncio.run(limiter.acquire_async("key", "model", 10, run_blocking))
+    assert calls == ["try_acquire"]
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def make_limiter(tmp_path, monkeypatch, requests_per_minute=60, tokens_per_minute=6000):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(time=clock, sleep=time.sleep))
+    limiter = RateLimiter(str(tmp_path / "ratelimit.sqlite3"), requests_per_minute, tokens_per_minute)
+    return limiter, clock
+
+def test_empty_request_bucket_refills_over_time(tmp_path, monkeypatch):
+    limiter, clock = make_limiter(tmp_path, monkeypatch, requests_per_minute=2)
+    assert limiter.try_acquire("key", "model") == 0
+    assert limiter.try_acquire("key", "model") == 0
+    assert limiter.try_acquire("key", "model") == 30.0
+
+    clock.now += 30
+    assert limiter.try_acquire("key", "model") == 0
+
+def test_token_bucket_waits_for_the_missing_tokens(tmp_path, monkeypatch):
+    limiter, clock = make_limiter(tmp_path, monkeypatch, tokens_per_minute=6000)
+    assert limiter.try_acquire("key", "model", 5000) == 0
+    assert limiter.try_acquire("key", "model", 2000) == 10.0
+
+    # A refund after the call used less than estimated frees the tokens at once
+    limiter.adjust("key", "model", -1000)
+    assert limiter.try_acquire("key", "model", 2000) == 0
+
+def test_calls_larger_than_the_budget_still_get_through(tmp_path, monkeypatch):
+    limiter, clock = make_limiter(tmp_path, monkeypatch, tokens_per_minute=6000)
+    assert limiter.try_acquire("key", "model", 50000) == 0
+
+def test_penalty_pauses_every_caller_on_the_key_and_model(tmp_path, monkeypatch):
+    limiter, clock = make_limiter(tmp_path, monkeypatch, requests_per_minute=60)
+    limiter.penalize("key", "model", 30)
+    assert limiter.try_acquire("key", "model") == 31.0
+    assert limiter.try_acquire("other key", "model") == 0
+    assert limiter.try_acquire("key", "other model") == 0
+
+    clock.now += 31
+    assert limiter.try_acquire("key", "model") == 0
+
+def test_buckets_are_shared_through_the_file(tmp_path, monkeypatch):
+    limiter, clock = make_limiter(tmp_path, monkeypatch, requests_per_minute=1)
+    other = RateLimiter(limiter.path, requests_per_minute=1)
+    assert limiter.try_acquire("key", "model") == 0
+    assert other.try_acquire("key", "model") == 60.0
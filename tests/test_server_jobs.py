@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+@pytest.fixture(autouse=True)
+def no_jobs_run(monkeypatch):
+    async def run_job_async(job, request):
+        pass
+    monkeypatch.setattr(main, "run_job_async", run_job_async)
+    monkeypatch.setattr(main, "ASYNC_ENGINE", True)
+    monkeypatch.setattr(main, "jobs", {})
+    monkeypatch.setattr(main, "inflight", {})
+
+def submit(*requests):
+    async def run():
+        responses = [await main.transcribe_video(main.TranscriptionRequest(**request)) for request in requests]
+        return [json.loads(response.body)["job_id"] for response in responses]
+    return asyncio.run(run())
+
+def test_links_to_the_same_video_share_a_job():
+    first, second = submit(
+        {"url": "https://youtu.be/dQw4w9WgXcQ", "api_key": "key"},
+        {"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=5s", "api_key": "key"},
+    )
+    assert first == second
+    assert main.jobs[first]["subscribers"] == 2
+
+def test_requests_with_different_keys_get_their_own_jobs(monkeypatch):
+    monkeypatch.setattr(main, "ALLOW_SERVER_KEYS", True)
+    first, second, third = submit(
+        {"url": "https://youtu.be/dQw4w9WgXcQ", "api_key": "key"},
+        {"url": "https://youtu.be/dQw4w9WgXcQ", "api_key": "other key"},
+        {"url": "https://youtu.be/dQw4w9WgXcQ", "api_key": ""},
+    )
+    assert len({first, second, third}) == 3
+
+def test_requests_without_a_key_need_the_server_keys_opt_in(monkeypatch):
+    monkeypatch.setattr(main, "ALLOW_SERVER_KEYS", False)
+    with pytest.raises(main.HTTPException) as error:
+        submit({"url": "https://youtu.be/dQw4w9WgXcQ"})
+    assert error.value.status_code == 422
+    monkeypatch.setattr(main, "ALLOW_SERVER_KEYS", True)
+    assert submit({"url": "https://youtu.be/dQw4w9WgXcQ"})
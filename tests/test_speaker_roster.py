@@ -0,0 +1,46 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import youtube_transcriber as yt
+from transcript_cache import TranscriptCache
+
+METADATA = {"id": "abcdefghijk", "title": "An interview"}
+BACKEND = SimpleNamespace(client=None, model_name="model", model=lambda: None)
+
+class FakePool:
+    def __init__(self, error=None):
+        self.error = error
+
+    def choose(self, estimated_tokens=0):
+        if self.error is not None:
+            raise self.error
+        return BACKEND
+
+@pytest.fixture
+def roster_calls(monkeypatch):
+    calls = []
+    def generate(client, model, prompt, limiter=None, model_name=None):
+        calls.append(prompt)
+        return SimpleNamespace(text="Host: interviewer")
+    monkeypatch.setattr(yt, "generate_roster_with_retry", generate)
+    return calls
+
+def test_failed_roster_is_kept_once_chunks_were_cut_with_it(tmp_path, roster_calls):
+    cache = TranscriptCache(str(tmp_path / "cache.sqlite3"))
+    assert yt.get_speaker_roster(FakePool(RuntimeError("429 Too Many Requests")), METADATA, cache) == ""
+    yt.save_chunk_plan(cache, METADATA["id"], [{"start": 0.0, "end": 600.0, "speech": 500.0}], "")
+
+    assert yt.get_speaker_roster(FakePool(), METADATA, cache) == ""
+    assert roster_calls == []
+
+def test_failed_roster_is_not_kept_before_any_chunk_is_cut(tmp_path, roster_calls):
+    cache = TranscriptCache(str(tmp_path / "cache.sqlite3"))
+    assert yt.get_speaker_roster(FakePool(RuntimeError("429 Too Many Requests")), METADATA, cache) == ""
+
+    assert yt.get_speaker_roster(FakePool(), METADATA, cache) == "Host: interviewer"
+    assert len(roster_calls) == 1
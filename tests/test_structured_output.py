@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_output import parse_entries, parse_timestamp, shift_entries
+
+def test_parse_timestamp():
+    assert parse_timestamp("01:02:03") == 3723
+    assert parse_timestamp("02:03.5") == 123.5
+    assert parse_timestamp("7,25") == 7.25
+    assert parse_timestamp(12) == 12.0
+    assert parse_timestamp("soon") is None
+    assert parse_timestamp(None) is None
+
+def test_missing_and_unordered_times_follow_the_neighbours():
+    text = json.dumps([
+        {"speaker": "Ann", "text": "Hi.", "start": "00:05", "end": "00:08"},
+        {"speaker": "", "text": "Hello.", "start": None, "end": "00:12"},
+        {"speaker": "Ann", "text": "Back.", "start": "00:03", "end": "00:01"},
+        {"speaker": "Bob", "text": "  ", "start": "00:20", "end": "00:21"},
+    ])
+    entries = parse_entries(text)
+    assert [(e["speaker"], e["start"], e["end"]) for e in entries] == [
+        ("Ann", 5.0, 8.0),
+        ("Unknown", 8.0, 12.0),
+        ("Ann", 8.0, 8.0),
+    ]
+
+def test_times_are_clamped_to_the_chunk_duration():
+    text = json.dumps([{"speaker": "Ann", "text": "Long.", "start": "00:50", "end": "01:30"}])
+    assert parse_entries(text, duration=60)[0]["end"] == 60
+    text = json.dumps([{"speaker": "Ann", "text": "Late.", "start": "02:00", "end": "02:05"}])
+    assert parse_entries(text, duration=60)[0]["start"] == 60
+
+def test_truncated_response_keeps_the_complete_entries():
+    text = '[{"speaker": "Ann", "text": "One.", "start": 1, "end": 2}, {"speaker": "Bob", "text": "Two.", "start": 3, "end": 4}, {"speaker": "Ann", "text": "Thr'
+    assert [e["text"] for e in parse_entries(text)] == ["One.", "Two."]
+
+def test_shift_entries_moves_to_the_video_timeline_and_drops_the_overlap():
+    entries = [
+        {"speaker": "Ann", "text": "Repeated.", "start": 2.0, "end": 4.0},
+        {"speaker": "Bob", "text": "New.", "start": 10.0, "end": 12.5},
+    ]
+    assert shift_entries(entries, 600, skip_before=5) == [
+        {"speaker": "Bob", "text": "New.", "start": 610.0, "end": 612.5},
+    ]
+    assert len(shift_entries(entries, 600)) == 2
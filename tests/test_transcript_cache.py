@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transcript_cache
+from transcript_cache import TranscriptCache, chunk_key, hash_file
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(transcript_cache, "time", SimpleNamespace(time=clock, sleep=time.sleep))
+    return clock
+
+def value(size):
+    return {"transcript": "x" * size}
+
+def test_entries_survive_reopening(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = TranscriptCache(path)
+    cache.put("key", value(10), kind="chunk", video_id="abc")
+    cache.close()
+    assert TranscriptCache(path).get("key") == value(10)
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, clock):
+    # Each value is about 120 bytes as JSON, so the budget holds two of them
+    cache = TranscriptCache(str(tmp_path / "cache.sqlite3"), max_bytes=250)
+    cache.put("first", value(100), kind="chunk")
+    clock.now += 1
+    cache.put("second", value(100), kind="chunk")
+    clock.now += 1
+    assert cache.get("first") is not None
+    clock.now += 1
+    cache.put("third", value(100), kind="chunk")
+
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+
+def test_entries_expire_by_age_even_when_read(tmp_path, clock):
+    cache = TranscriptCache(str(tmp_path / "cache.sqlite3"), max_age=60)
+    cache.put("key", value(10), kind="video")
+    clock.now += 30
+    assert cache.get("key") is not None
+    clock.now += 31
+    assert cache.get("key") is None
+
+def test_chunk_keys_change_with_anything_that_changes_the_transcript():
+    base = ("abc", "hash", "model", {"temperature": 0.3}, "prompt")
+    keys = {
+        chunk_key(*base),
+        chunk_key("other", *base[1:]),
+        chunk_key("abc", "other hash", *base[2:]),
+        chunk_key("abc", "hash", "other model", *base[3:]),
+        chunk_key("abc", "hash", "model", {"temperature": 0.5}, "prompt"),
+        chunk_key("abc", "hash", "model", {"temperature": 0.3}, "other prompt"),
+    }
+    assert len(keys) == 6
+    assert chunk_key(*base) == chunk_key(*base)
+
+def test_hash_file_reads_in_blocks(tmp_path):
+    path = tmp_path / "chunk.aac"
+    path.write_bytes(b"a" * 10)
+    assert hash_file(str(path), block_size=3) == hash_file(str(path))
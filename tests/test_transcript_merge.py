@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcript_merge import merge_transcripts
+
+def test_repeated_words_are_kept_without_overlap():
+    parts = [
+        "**Host:** Welcome back. Thank you so much for having me on the show today.",
+        "**Guest:** Thank you so much for having me on the show today, it is an honor.",
+    ]
+    merged = merge_transcripts(parts)
+    assert merged.endswith("**Guest:** Thank you so much for having me on the show today, it is an honor.")
+
+def test_overlapping_text_is_dropped_with_overlap():
+    parts = [
+        "**Host:** We talked about rockets and how they land on the barge at sea.",
+        "**Host:** how they land on the barge at sea. Next question.",
+    ]
+    merged = merge_transcripts(parts, overlap=5)
+    assert merged.count("barge") == 1
+    assert merged.endswith("at sea. Next question.")
+
+def test_plain_lines_are_not_speaker_labels():
+    parts = ["**Elon Musk:** Hello.\nNote: this is important.", "**Elon:** Bye."]
+    merged = merge_transcripts(parts)
+    assert "Note: this is important." in merged
+    assert "**Note:**" not in merged
+
+def test_bold_labels_are_unified():
+    merged = merge_transcripts(["**Elon Musk:** Hello.", "**Elon**: Bye."])
+    assert merged == "**Elon Musk:** Hello.\n\n**Elon Musk:** Bye."
@@ -0,0 +1,60 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import youtube_transcriber as yt
+from upload_registry import UploadRegistry
+
+class FakeClient:
+    api_key = "key"
+
+    def __init__(self):
+        self.files = {}
+        self.uploads = 0
+
+    def upload_file(self, path, mime_type=None):
+        self.uploads += 1
+        file = SimpleNamespace(name=f"files/{self.uploads}", state=SimpleNamespace(name="ACTIVE"))
+        self.files[file.name] = file
+        return file
+
+    def get_file(self, name):
+        return self.files[name]
+
+    def delete_file(self, name):
+        del self.files[name]
+
+def test_shared_upload_is_deleted_by_its_last_holder(tmp_path, monkeypatch):
+    registry = UploadRegistry(str(tmp_path / "uploads.sqlite3"))
+    monkeypatch.setattr(yt, "get_default_registry", lambda: registry)
+    client = FakeClient()
+    chunk_path = tmp_path / "chunk.aac"
+    chunk_path.write_bytes(b"audio")
+
+    first = yt.upload_chunk(client, str(chunk_path), "hash")
+    second = yt.upload_chunk(client, str(chunk_path), "hash")
+    assert second.name == first.name
+    assert client.uploads == 1
+
+    yt.release_upload(client, first, "hash")
+    assert first.name in client.files
+    yt.release_upload(client, second, "hash")
+    assert client.files == {}
+    assert registry.get(client.api_key, "hash") is None
+
+def test_failed_chunk_keeps_its_upload_for_the_retry(tmp_path, monkeypatch):
+    registry = UploadRegistry(str(tmp_path / "uploads.sqlite3"))
+    monkeypatch.setattr(yt, "get_default_registry", lambda: registry)
+    client = FakeClient()
+    chunk_path = tmp_path / "chunk.aac"
+    chunk_path.write_bytes(b"audio")
+
+    file = yt.upload_chunk(client, str(chunk_path), "hash")
+    yt.release_upload(client, file, "hash", delete=False)
+    assert registry.get(client.api_key, "hash") == file.name
+
+    retried = yt.upload_chunk(client, str(chunk_path), "hash")
+    assert retried.name == file.name
+    assert client.uploads == 1
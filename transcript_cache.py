@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Constants
+CACHE_PATH = os.getenv(
+    "TRANSCRIPT_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "youtube2transcripts", "transcripts.sqlite3"),
+)
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Evict least recently used entries above this size
+CACHE_MAX_AGE = 30 * 24 * 60 * 60  # Entries older than 30 days are dropped
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def hash_file(path, block_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_key(kind, **parts):
+    """Build a cache key from everything that can change the transcript."""
+    payload = json.dumps({"kind": kind, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def chunk_key(video_id, chunk_hash, model_name, generation_config, prompt):
+    return make_key(
+        "chunk",
+        video_id=video_id,
+        chunk_hash=chunk_hash,
+        model_name=model_name,
+        generation_config=generation_config,
+        prompt=prompt,
+    )
+
+def video_key(video_id, model_name, generation_config, prompt, chunk_duration, **options):
+    return make_key(
+        "video",
+        video_id=video_id,
+        model_name=model_name,
+        generation_config=generation_config,
+        prompt=prompt,
+        chunk_duration=chunk_duration,
+        **options,
+    )
+
+class TranscriptCache:
+    """Persistent SQLite store of finished transcripts with size and age based eviction."""
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " video_id TEXT,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.max_age and created < now - self.max_age:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def put(self, key, value, kind, video_id=None):
+        now = time.time()
+        data = json.dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, video_id, value, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, video_id, data, len(data.encode('utf-8')), now, now),
+            )
+            self._evict(now)
+
+    def evict(self):
+        with self._lock, self._conn:
+            self._evict(time.time())
+
+    def _evict(self, now):
+        if self.max_age:
+            self._conn.execute("DELETE FROM entries WHERE created < ?", (now - self.max_age,))
+        if not self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        expired = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", expired)
+        logger.info(f"Evicted {len(expired)} cached transcripts")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_default_cache():
+    """Return the process-wide cache, or None when disabled with TRANSCRIPT_CACHE=0."""
+    global _default_cache
+    if os.getenv("TRANSCRIPT_CACHE", "1") == "0":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TranscriptCache()
+        return _default_cache
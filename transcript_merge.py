@@ -0,0 +1,99 @@
+import re
+import difflib
+
+# Constants
+SEAM_WORDS = 150  # Words at the end/start of neighbouring parts compared for duplicates
+MIN_DUPLICATE_WORDS = 6  # Shorter matches are treated as coincidence
+SEAM_SLACK_WORDS = 40  # How far from the seam a duplicate may start/end
+
+# "**Name:** text" and "**Name**: text" at the start of a line. Plain "Name: text" is left
+# alone, since lines like "Note: ..." can't be told apart from speaker labels
+SPEAKER_LINE_PATTERN = re.compile(
+    r"^[ \t]*\*\*(?P<name>[^*\n:]{1,60}?)(?::\*\*|\*\*:)[ \t]*",
+    re.MULTILINE,
+)
+WORD_PATTERN = re.compile(r"\S+")
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+def _name_key(name):
+    return tuple(_normalize_word(word) for word in name.split() if _normalize_word(word))
+
+def canonical_speakers(parts):
+    """Map every speaker label used in the parts to one spelling per speaker.
+
+    Labels that only differ in case or punctuation are merged, and a label whose
+    words are all part of exactly one longer label ("Elon" and "Elon Musk") is
+    folded into it. The first spelling seen wins.
+    """
+    names = []
+    for part in parts:
+        for match in SPEAKER_LINE_PATTERN.finditer(part):
+            name = match.group("name").strip()
+            if name not in names:
+                names.append(name)
+
+    canonical = {}
+    by_key = {}
+    for name in names:
+        key = _name_key(name)
+        if key in by_key:
+            canonical[name] = by_key[key]
+            continue
+        by_key[key] = name
+        canonical[name] = name
+
+    for name, target in list(canonical.items()):
+        key = set(_name_key(target))
+        longer = {
+            other for other_key, other in by_key.items()
+            if key and len(other_key) > len(key) and key <= set(other_key)
+        }
+        if len(longer) == 1:
+            canonical[name] = longer.pop()
+    return canonical
+
+def normalize_speakers(text, canonical):
+    """Rewrite speaker labels as "**Name:**" using the canonical spelling."""
+    def replace(match):
+        name = match.group("name").strip()
+        return f"**{canonical.get(name, name)}:** "
+    return SPEAKER_LINE_PATTERN.sub(replace, text)
+
+def _strip_seam_duplicate(previous, current):
+    """Drop the start of `current` if it repeats the end of `previous` (from overlapping audio)."""
+    tail = [_normalize_word(m.group()) for m in WORD_PATTERN.finditer(previous)][-SEAM_WORDS:]
+    head_matches = list(WORD_PATTERN.finditer(current))[:SEAM_WORDS]
+    head = [_normalize_word(m.group()) for m in head_matches]
+    if not tail or not head:
+        return current
+
+    matcher = difflib.SequenceMatcher(None, tail, head, autojunk=False)
+    match = matcher.find_longest_match(0, len(tail), 0, len(head))
+    near_seam = match.a + match.size >= len(tail) - SEAM_SLACK_WORDS and match.b <= SEAM_SLACK_WORDS
+    if match.size < MIN_DUPLICATE_WORDS or not near_seam:
+        return current
+    return current[head_matches[match.b + match.size - 1].end():]
+
+def merge_transcripts(parts, overlap=0):
+    """Join chunk transcripts into one with one spelling per speaker label.
+
+    With an `overlap` (seconds of audio each part repeats from the one before)
+    text duplicated across a seam is dropped too. Without one nothing is
+    dropped, so a speaker repeating the previous one's words is kept.
+    """
+    canonical = canonical_speakers(parts)
+    merged = ""
+    for part in parts:
+        part = normalize_speakers(part.strip(), canonical)
+        if not merged:
+            merged = part
+            continue
+        rest = _strip_seam_duplicate(merged, part) if overlap > 0 else part
+        if rest is part or SPEAKER_LINE_PATTERN.match(rest.lstrip()) or not rest.strip():
+            merged = f"{merged}\n\n{rest.strip()}" if rest.strip() else merged
+        else:
+            # The duplicate ended mid-line, so the rest continues the last speaker's line
+            merged = f"{merged} {rest.strip()}"
+    return merged
@@ -0,0 +1,111 @@
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Constants
+REGISTRY_PATH = os.getenv(
+    "UPLOAD_REGISTRY_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "youtube2transcripts", "uploads.sqlite3"),
+)
+UPLOAD_LIFETIME = 48 * 60 * 60  # Gemini deletes uploaded files after 48 hours
+EXPIRY_MARGIN = 60 * 60  # Don't reuse files that expire within the hour
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+class UploadRegistry:
+    """Remember which chunk audio is already uploaded to Gemini, per API key.
+
+    Entries are keyed by the hash of the chunk's contents, so a retry or a later
+    run over the same audio can reuse the remote file instead of uploading it
+    again. Files belong to the API key's project, so keys are part of the lookup;
+    they are hashed before they are written to disk.
+
+    Chunks of concurrent jobs over the same audio share a file, so each chunk
+    holds the file while it uses it, and only the last holder in the process
+    deletes it.
+    """
+
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._holds = Counter()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                " api_key TEXT NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " expires REAL NOT NULL,"
+                " PRIMARY KEY (api_key, content_hash))"
+            )
+
+    def _key(self, api_key):
+        return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+    def get(self, api_key, content_hash, margin=EXPIRY_MARGIN):
+        """Return the remote file name for this content if it won't expire within `margin` seconds."""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT name, expires FROM uploads WHERE api_key = ? AND content_hash = ?",
+                (self._key(api_key), content_hash),
+            ).fetchone()
+        if row is None or row[1] < time.time() + margin:
+            return None
+        return row[0]
+
+    def put(self, api_key, content_hash, name, expires=None):
+        expires = expires or time.time() + UPLOAD_LIFETIME
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploads (api_key, content_hash, name, expires) VALUES (?, ?, ?, ?)",
+                (self._key(api_key), content_hash, name, expires),
+            )
+            self._conn.execute("DELETE FROM uploads WHERE expires < ?", (time.time(),))
+
+    def remove(self, api_key, content_hash, name=None):
+        """Forget the upload of this content, or with a `name` only if it is still that file."""
+        query = "DELETE FROM uploads WHERE api_key = ? AND content_hash = ?"
+        params = (self._key(api_key), content_hash)
+        if name is not None:
+            query += " AND name = ?"
+            params += (name,)
+        with self._lock, self._conn:
+            self._conn.execute(query, params)
+
+    def hold(self, api_key, name):
+        """Mark a remote file as used by one more chunk in this process."""
+        with self._lock:
+            self._holds[(self._key(api_key), name)] += 1
+
+    def release(self, api_key, name):
+        """Give up a hold on a remote file; returns True when no other chunk in this process holds it."""
+        key = (self._key(api_key), name)
+        with self._lock:
+            self._holds[key] -= 1
+            if self._holds[key] > 0:
+                return False
+            del self._holds[key]
+            return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_default_registry():
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = UploadRegistry()
+        return _default_registry
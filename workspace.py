@@ -0,0 +1,149 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Constants
+WORKSPACE_ROOT = os.getenv("AUDIO_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "youtube2transcripts"))
+DISK_BUDGET = int(os.getenv("AUDIO_DISK_BUDGET_MB", "4096")) * 1024 * 1024  # Disk all open workspaces may claim together
+JOB_DISK_RESERVATION = 512 * 1024 * 1024  # Claimed per job: a few hours of audio plus its chunks
+MIN_FREE_DISK = 1024 * 1024 * 1024  # Never admit a job that would leave less than this free
+BUDGET_POLL_INTERVAL = 1.0  # Seconds between checks while waiting for disk budget
+
+_default_budget = None
+_default_budget_lock = threading.Lock()
+
+class DiskBudget:
+    """Admit jobs only while their disk reservations fit in the budget and on the disk.
+
+    Reservations are fixed estimates claimed up front, so a job that is admitted
+    doesn't run out of room halfway through a download.
+    """
+
+    def __init__(self, max_bytes=DISK_BUDGET, root=WORKSPACE_ROOT, min_free=MIN_FREE_DISK):
+        self.max_bytes = max_bytes
+        self.root = root
+        self.min_free = min_free
+        self.reserved = 0
+        self._condition = threading.Condition()
+
+    def try_acquire(self, size):
+        """Reserve `size` bytes if they fit right now, without waiting."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._condition:
+            if not self._fits(size):
+                return False
+            self.reserved += size
+            return True
+
+    def _fits(self, size):
+        if self.reserved and self.reserved + size > self.max_bytes:
+            return False
+        # Space already claimed by other jobs may not be written yet, so count it as used
+        free = shutil.disk_usage(self.root).free - self.reserved
+        return self.reserved == 0 or free - size >= self.min_free
+
+    def acquire(self, size, cancel_event=None):
+        """Wait until `size` bytes can be reserved. Returns False if cancelled while waiting."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._condition:
+            waited = False
+            while not self._fits(size):
+                if not waited:
+                    logger.info(f"Waiting for disk budget ({self.reserved // 2**20} MB of {self.max_bytes // 2**20} MB reserved)")
+                    waited = True
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                self._condition.wait(BUDGET_POLL_INTERVAL)
+            self.reserved += size
+            return True
+
+    def release(self, size):
+        with self._condition:
+            self.reserved = max(0, self.reserved - size)
+            self._condition.notify_all()
+
+class Workspace:
+    """A private directory for one job's audio and chunks, deleted when the job ends however it ends.
+
+    Opening it reserves disk from the budget and may wait for other jobs to
+    finish. Use it as a context manager, or call open() and close() when the
+    job's lifetime spans several threads.
+    """
+
+    def __init__(self, budget=None, reservation=JOB_DISK_RESERVATION, root=WORKSPACE_ROOT):
+        self.budget = budget
+        self.reservation = reservation
+        self.root = root
+        self.path = None
+        self._reserved = False
+
+    def open(self, cancel_event=None):
+        if self.budget is not None:
+            if not self.budget.acquire(self.reservation, cancel_event):
+                return None
+            self._reserved = True
+        return self._create()
+
+    def try_open(self):
+        """Open the workspace if the budget has room right now, otherwise return None."""
+        if self.budget is not None:
+            if not self.budget.try_acquire(self.reservation):
+                return None
+            self._reserved = True
+        return self._create()
+
+    def _create(self):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            self.path = tempfile.mkdtemp(prefix=f"job-{os.getpid()}-", dir=self.root)
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def close(self):
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+        if self._reserved:
+            self.budget.release(self.reservation)
+            self._reserved = False
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def remove_stale_workspaces(root=WORKSPACE_ROOT):
+    """Delete workspaces left behind by processes that died without cleaning up."""
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        parts = name.split("-")
+        if len(parts) < 3 or parts[0] != "job" or not parts[1].isdigit():
+            continue
+        pid = int(parts[1])
+        if pid == os.getpid():
+            continue
+        try:
+            os.kill(pid, 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            # The process exists but belongs to someone else
+            continue
+        logger.info(f"Removing stale workspace {name}")
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def get_default_budget():
+    global _default_budget
+    with _default_budget_lock:
+        if _default_budget is None:
+            _default_budget = DiskBudget()
+        return _default_budget
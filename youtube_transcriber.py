@@ -1,15 +1,30 @@
 import os
+import sys
 import logging
-from tqdm import tqdm
-import google.generativeai as genai
+import argparse
 from dotenv import load_dotenv
-import yt_dlp
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from tenacity import retry, stop_after_attempt, wait_exponential
-from ratelimit import limits, sleep_and_retry
-from pydub import AudioSegment
+from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
 import warnings
 import time
+import math
+import re
+import subprocess
+import json
+from transcript_cache import get_default_cache, hash_file, chunk_key, video_key, make_key
+from chunk_planner import iter_silences, iter_chunk_spans, split_span, get_default_density, MIN_CHUNK_DURATION, SILENCE_SEARCH_WINDOW
+from transcript_merge import merge_transcripts
+from structured_output import (
+    EntryLog, TRANSCRIPT_SCHEMA, parse_entries, shift_entries, render_markdown, write_entries, write_renderings,
+)
+from captions import fetch_captions, group_captions, fetch_title, CAPTION_MODES
+from gemini_client import get_client
+from gemini_pool import GeminiPool, get_pool, get_health, parse_weighted
+from upload_registry import get_default_registry
+from workspace import Workspace, WORKSPACE_ROOT, remove_stale_workspaces
+import metrics
+from manifest import Manifest
+from rate_limiter import get_default_limiter, is_rate_limit_error, AUDIO_TOKENS_PER_SECOND
 
 # Suppress SyntaxWarnings
 warnings.filterwarnings("ignore", category=SyntaxWarning)
@@ -23,9 +38,131 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Constants
-CALLS_PER_SECOND = 1.8  # Slightly lower than 2 to add buffer
-PERIOD = 1  # 1 second
-MAX_WORKERS = 2  # Concurrent jobs limit
+UPLOAD_BUDGET = "files"  # Rate limit bucket shared by all uploads for a key
+RATE_LIMIT_PAUSE = 30  # Seconds every worker holds off after a 429
+MAX_OUTPUT_TOKENS = 8192
+TRANSCRIPT_DIR = "transcripts_better"
+MANIFEST_PATH = os.path.join(TRANSCRIPT_DIR, "manifest.jsonl")  # Batch run state, used to resume
+MAX_CHUNK_WORKERS = 4  # Concurrent chunk uploads/transcriptions per video
+CHUNK_DURATION = 20 * 60  # 20-minute chunks (to be safe), in seconds
+ADAPTIVE_CHUNKS = True  # Size chunks by how much speech fits in MAX_OUTPUT_TOKENS instead of CHUNK_DURATION
+MAX_CHUNK_DURATION = 40 * 60  # Longest adaptive chunk, reached in audio with little speech, in seconds
+MAX_RESPLIT_DEPTH = 2  # Times a chunk whose transcript was cut off is split in two again before the cut-off transcript is kept
+NATIVE_AUDIO = True  # Keep YouTube's own audio stream instead of transcoding it to MP3
+SPEECH_OPTIMIZE = False  # Re-encode chunks to low bitrate mono Opus when that is smaller
+SPEECH_BITRATE = 32  # kbps, target bitrate for speech-optimized chunks
+SILENCE_AWARE = True  # Cut chunks at pauses near CHUNK_DURATION instead of at exact offsets
+CHUNK_OVERLAP = 0  # Seconds each chunk repeats from the end of the previous one
+MERGE_PARTS = True  # Merge chunk transcripts seamlessly instead of joining them with part breaks
+CHUNK_RETRY_ROUNDS = 2  # Extra attempts at a chunk whose API retries all failed, before leaving a gap
+CHUNK_RETRY_DELAY = 30  # Seconds before the first extra attempt, doubling each round
+CAPTIONS_MODE = "off"  # "manual" or "any" to use YouTube's captions instead of the audio when they exist
+CAPTION_ATTRIBUTION = True  # Send caption text to Gemini to add speaker names
+ROSTER_PASS = True  # Ask once per video for its speakers, from the title and description, and give the list to every chunk
+ROSTER_DESCRIPTION_CHARS = 4000  # Description text sent with the roster prompt
+ROSTER_OUTPUT_TOKENS = 512  # Expected length of a roster, for the rate limit estimate
+STRUCTURED_OUTPUT = False  # Ask for JSON turns with speakers and timestamps, streamed to a .jsonl file and rendered as .srt/.vtt too
+
+AUDIO_MIME_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".aac": "audio/aac",
+    ".ogg": "audio/ogg",
+    ".flac": "audio/flac",
+    ".wav": "audio/wav",
+}
+# Containers Gemini doesn't accept, mapped to one their stream can be copied into
+REMUX_CONTAINERS = {
+    ".m4a": ".aac",
+    ".mp4": ".aac",
+    ".webm": ".ogg",
+    ".opus": ".ogg",
+}
+# Ogg gets a random stream serial per run otherwise; the same span must always hash the same for the cache and upload registry
+BITEXACT_ARGS = ["-fflags", "+bitexact", "-flags:a", "+bitexact"]
+
+MODEL_NAME = "gemini-1.5-flash"  # Used unless GEMINI_MODELS lists models (with optional weights, "name:2")
+GENERATION_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.95,
+    "top_k": 40,
+    "response_mime_type": "text/plain",
+}
+DIARIZATION_PROMPT = (
+    "Generate audio diarization, including transcriptions and speaker information for each transcription. "
+    "Organize the transcription by the time they happened. No time stamps. "
+    "Infer speaker name from the audio. Text output only, no JSON formatting. "
+    "Start each speaker's turn on a new line with their name in bold followed by a colon, like **Name:**, "
+    "and spell each name the same way every time. "
+    "If it's a single speaker, break it into paragraphs. "
+)
+STRUCTURED_PROMPT = (
+    "Generate audio diarization: transcribe the audio and split it into speaker turns, in the order they happened. "
+    "For each turn give the speaker's name, what they said, and when the turn starts and ends as MM:SS "
+    "from the start of this audio. "
+    "Infer speaker name from the audio, and spell each name the same way every time. "
+    "If it's a single speaker, make each paragraph a turn. "
+)
+# Applied on top of GENERATION_CONFIG to chunk calls only; the roster and caption calls stay plain text
+STRUCTURED_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": TRANSCRIPT_SCHEMA,
+}
+ROSTER_PROMPT = (
+    "Below are the title, channel, description and chapters of a YouTube video. "
+    "List the people who are likely to speak in it, one per line as \"Name: role\", "
+    "with each name spelled the way it should appear in a transcript. "
+    "Then, after a line \"Spellings:\", list names, products and terms from the text that are easy to mishear. "
+    "Only use what the text supports. Text output only, no JSON formatting.\n\n"
+)
+ROSTER_SECTION = (
+    "\n\nThe video's description suggests these speakers and spellings. "
+    "Use these names for the speakers you recognize and infer the others:\n{roster}\n\n"
+)
+
+SPEAKER_ATTRIBUTION_PROMPT = (
+    "Below are the captions of part {part} of {total} of a YouTube video titled \"{title}\". "
+    "Turn them into a transcript with speaker information for each transcription. "
+    "Infer speaker name from the content. Keep the wording of the captions. No time stamps. "
+    "Text output only, no JSON formatting. "
+    "New line between each speaker's transcript. "
+    "If it's a single speaker, break it into paragraphs.\n\n"
+)
+PART_SEPARATOR = "\n\n=== Part Break ===\n\n"
+GAP_MARKER = "**[Part {part} of {total} could not be transcribed: {error}]**"
+
+# A watch URL that also has &list= stays a single video
+PLAYLIST_PATTERN = re.compile(r"/playlist\b|/@|/channel/|/c/|/user/")
+YOUTUBE_ID_PATTERN = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/|/v/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])")
+
+class JobCancelled(Exception):
+    pass
+
+class IncompleteTranscript(Exception):
+    """Some chunks failed every retry; `transcript` has gap markers where they belong."""
+
+    def __init__(self, transcript, missing, total):
+        super().__init__(f"Parts {', '.join(str(part) for part in missing)} of {total} could not be transcribed")
+        self.transcript = transcript
+        self.missing = missing
+        self.total = total
+
+def describe_error(error):
+    """Return the message of the error behind a tenacity RetryError, or of the error itself."""
+    if isinstance(error, RetryError) and error.last_attempt.failed:
+        error = error.last_attempt.exception()
+    return str(error) or type(error).__name__
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled("Job was cancelled")
+
+def emit(on_progress, event, **data):
+    if on_progress is None:
+        return
+    try:
+        on_progress({"event": event, **data})
+    except Exception as e:
+        logger.warning(f"Progress callback failed for {event}: {str(e)}")
 
 def sanitize_filename(filename):
     # Enhanced sanitization
@@ -35,234 +172,1193 @@ def sanitize_filename(filename):
     filename = filename.replace(' ', '_')  # Replace spaces with underscores
     return filename.strip()
 
-def download_audio(url, output_path="/tmp/audio"):
+def extract_video_id(url):
+    match = YOUTUBE_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+def canonical_url(url):
+    """Return the plain watch URL for any link to a video (youtu.be, shorts, embeds, &t=...), so each video has one URL.
+
+    URLs that aren't recognized as a single video are returned unchanged.
+    """
+    url = url.strip()
+    video_id = extract_video_id(url)
+    return f"https://www.youtube.com/watch?v={video_id}" if video_id else url
+
+def configured_models():
+    """Model names to spread chunks over, with their weights, from GEMINI_MODELS."""
+    return parse_weighted(os.getenv("GEMINI_MODELS") or MODEL_NAME)
+
+def models_cache_name():
+    # Just MODEL_NAME by default, so single-model cache entries stay valid
+    return "+".join(sorted(configured_models()))
+
+def resolve_pool(client=None):
+    """Return the pool chunks are sent to.
+
+    That is `client` itself if it is a pool, a pool over `client`'s key, or
+    with no client one over every key in GEMINI_API_KEYS (comma separated,
+    optionally weighted like "key:2"), falling back to GEMINI_API_KEY.
+    """
+    if isinstance(client, GeminiPool):
+        return client
+    if client is not None:
+        clients = [(client, 1.0)]
+    else:
+        keys = parse_weighted(os.getenv("GEMINI_API_KEYS") or os.getenv("GEMINI_API_KEY") or "")
+        if not keys:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        clients = [(get_client(key), weight) for key, weight in keys.items()]
+    return get_pool(clients, configured_models(), GENERATION_CONFIG)
+
+def chunk_generation_config():
+    return STRUCTURED_GENERATION_CONFIG if STRUCTURED_OUTPUT else {}
+
+def base_chunk_prompt():
+    return STRUCTURED_PROMPT if STRUCTURED_OUTPUT else DIARIZATION_PROMPT
+
+def video_cache_key(video_id, chunk_duration=CHUNK_DURATION):
+    return video_key(
+        video_id, models_cache_name(), {**GENERATION_CONFIG, **chunk_generation_config()}, base_chunk_prompt(), chunk_duration,
+        silence_aware=SILENCE_AWARE, overlap=CHUNK_OVERLAP, merge=MERGE_PARTS, adaptive=ADAPTIVE_CHUNKS,
+        roster=ROSTER_PROMPT if ROSTER_PASS else None,
+    )
+
+def cache_lookup(cache, key, kind):
+    """Look a key up in the cache, counting the hit or miss."""
+    cached = cache.get(key)
+    metrics.inc("cache_requests_total", kind=kind, result="miss" if cached is None else "hit")
+    return cached
+
+def roster_section(roster):
+    return ROSTER_SECTION.format(roster=roster) if roster else ""
+
+def chunk_prompt(part, total_parts, roster=""):
+    return base_chunk_prompt() + roster_section(roster) + f"This is part {part} of {total_parts}."
+
+def chunk_cache_key(video_id, content_hash, model_name=MODEL_NAME, roster=""):
+    # The part note only affects wording, so a chunk's result is reused whatever its position
+    return chunk_key(
+        video_id, content_hash, model_name, {**GENERATION_CONFIG, **chunk_generation_config()},
+        base_chunk_prompt() + roster_section(roster),
+    )
+
+def lookup_cached_chunk(cache, video_id, content_hash, model_names, roster=""):
+    """Return a chunk's cached transcript from whichever of the pool's models produced it."""
+    for model_name in model_names:
+        cached = cache.get(chunk_cache_key(video_id, content_hash, model_name, roster))
+        if cached is not None:
+            break
+    metrics.inc("cache_requests_total", kind="chunk", result="miss" if cached is None else "hit")
+    return cached
+
+def combine_parts(parts, overlap=0):
+    if MERGE_PARTS:
+        return merge_transcripts(parts, overlap)
+    return PART_SEPARATOR.join(parts)
+
+def transcript_path(base_name, ext=".md"):
+    return os.path.join(TRANSCRIPT_DIR, f"transcript_{base_name}{ext}")
+
+def transcript_base_name(original_title=None, audio_path=None):
+    if original_title:
+        return sanitize_filename(original_title)
+    return sanitize_filename(os.path.splitext(os.path.basename(audio_path))[0])
+
+def save_transcript(transcript, base_name):
+    os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
     
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
+    path = transcript_path(base_name)
     
-    # First get the info without downloading
-    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-        info = ydl.extract_info(url, download=False)
-        title = info['title']
-        # Sanitize the filename before download
-        sanitized_title = sanitize_filename(title)
+    with metrics.span("write"), open(path, 'w', encoding='utf-8') as f:
+        f.write(transcript)
         
-        # Check if file already exists
-        expected_filepath = os.path.join(output_path, f"{sanitized_title}.mp3")
-        if os.path.exists(expected_filepath):
-            logger.info(f"File already exists: {expected_filepath}")
-            return expected_filepath, title
+    logger.info(f"✓ Transcript saved: {path}")
+    return path
+
+def save_structured_transcript(entries, base_name, video_id=None):
+    """Write a finished video's entries as JSONL, SRT and WebVTT at once, for transcripts that come from the cache."""
+    path = transcript_path(base_name, ".jsonl")
+    with metrics.span("write"):
+        write_entries(path, entries, video_id)
+        write_renderings(os.path.splitext(path)[0], entries)
+    return path
+
+def open_entry_log(audio_path, original_title=None, video_id=None):
+    """Start the JSONL file a video's chunks append their entries to, or return None outside structured mode."""
+    if not STRUCTURED_OUTPUT:
+        return None
+    return EntryLog(transcript_path(transcript_base_name(original_title, audio_path), ".jsonl"), video_id)
+
+def chunk_result(response, duration=None):
+    """Return a chunk's transcript: text, or in structured mode its entries with times from the chunk's start."""
+    if STRUCTURED_OUTPUT:
+        return parse_entries(response.text, duration)
+    return response.text
+
+def chunk_text(result):
+    return render_markdown(result) if isinstance(result, list) else result
+
+def merge_halves(halves, results):
+    if STRUCTURED_OUTPUT:
+        # Each half repeats CHUNK_OVERLAP seconds of the one before; its entries from there are already in
+        return [
+            entry
+            for i, (half, entries) in enumerate(zip(halves, results))
+            for entry in shift_entries(entries, half["start"], CHUNK_OVERLAP if i else 0)
+        ]
+    return merge_transcripts(results, CHUNK_OVERLAP)
+
+def record_chunk(result, chunk, part, entry_log=None):
+    """Add a finished chunk's entries to the video's entry log on the video's timeline, and return the chunk as text."""
+    if not isinstance(result, list):
+        return result
+    if entry_log is not None:
+        # Segment-muxer chunks have no known offsets, but are CHUNK_DURATION long and don't overlap
+        if chunk["start"] is None:
+            offset, overlap = (part - 1) * CHUNK_DURATION, 0
+        else:
+            offset, overlap = chunk["start"], CHUNK_OVERLAP if part > 1 else 0
+        entry_log.append(part, shift_entries(result, offset, overlap))
+    return render_markdown(result)
+
+def video_metadata(info):
+    return {
+        "id": info.get("id"),
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "chapters": info.get("chapters") or [],
+        "uploader": info.get("uploader"),
+        "description": info.get("description"),
+        "webpage_url": info.get("webpage_url"),
+    }
+
+def audio_mime_type(path):
+    return AUDIO_MIME_TYPES.get(os.path.splitext(path)[1].lower(), "audio/mpeg")
+
+def download_audio(url, output_path=None, native_audio=NATIVE_AUDIO):
+    """Download the audio of a video and return its path along with the video's metadata.
+
+    The page is only extracted once; the same info dict is reused for the download.
+    With native_audio the best audio stream is kept in its own container (m4a/webm)
+    instead of being transcoded to MP3. Pass the job's workspace as output_path;
+    without one files go straight into AUDIO_OUTPUT_DIR.
+    """
+    import yt_dlp
+    output_path = output_path or WORKSPACE_ROOT
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
     
     ydl_opts = {
+        'quiet': True,
         'format': 'bestaudio/best',
-        'postprocessors': [{
+        # Name files by video ID so titles never need sanitizing or collide
+        'outtmpl': os.path.join(output_path, '%(id)s.%(ext)s'),
+    }
+    if not native_audio:
+        ydl_opts['postprocessors'] = [{
             'key': 'FFmpegExtractAudio',
             'preferredcodec': 'mp3',
             'preferredquality': '192',
-        }],
-        # Use pre-sanitized filename
-        'outtmpl': os.path.join(output_path, sanitized_title + '.%(ext)s'),
-    }
+        }]
     
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with metrics.span("extract"):
+            info = ydl.extract_info(url, download=False)
+        metadata = video_metadata(info)
+        
+        # Check if file already exists
+        if native_audio:
+            expected_filepath = ydl.prepare_filename(info)
+        else:
+            expected_filepath = os.path.join(output_path, f"{info['id']}.mp3")
+        if os.path.exists(expected_filepath):
+            logger.info(f"File already exists: {expected_filepath}")
+            return expected_filepath, metadata
+        
         logger.info(f"Downloading: {url}")
-        ydl.download([url])
-        filename = f"{sanitized_title}.mp3"
-        filepath = os.path.join(output_path, filename)
-        logger.info(f"Downloaded: {filename}")
-        return filepath, title
-
-@sleep_and_retry
-@limits(calls=CALLS_PER_SECOND, period=PERIOD)
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def upload_to_gemini_with_retry(path, mime_type=None):
+        with metrics.span("download"):
+            info = ydl.process_ie_result(info, download=True)
+        downloads = info.get('requested_downloads') or [{}]
+        filepath = downloads[0].get('filepath') or expected_filepath
+        logger.info(f"Downloaded: {os.path.basename(filepath)}")
+        return filepath, metadata
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), before_sleep=metrics.count_retry("upload"))
+def upload_to_gemini_with_retry(client, path, mime_type=None, limiter=None, model_name=None):
+    """Upload a file inside the key's upload budget.
+
+    Failures count against the health of `model_name` on this key, the backend
+    the upload is for, so a key whose uploads keep failing is taken out of
+    rotation like one whose generate calls do.
+    """
+    limiter = limiter or get_default_limiter()
     try:
+        with metrics.span("rate_limit_wait"):
+            limiter.acquire(client.api_key, UPLOAD_BUDGET)
         logger.debug(f"Starting upload for: {os.path.basename(path)}")
-        genai.configure(
-            api_key=os.getenv("GEMINI_API_KEY"),
-            transport="rest"
-        )
-        file = genai.upload_file(path, mime_type=mime_type)
+        with metrics.span("upload"):
+            file = client.upload_file(path, mime_type=mime_type)
+        metrics.inc("uploaded_bytes_total", os.path.getsize(path))
         logger.debug(f"Upload complete: {os.path.basename(path)}")
         return file
     except Exception as e:
+        if model_name is not None:
+            get_health().record_failure(client.api_key, model_name, e)
+        if is_rate_limit_error(e):
+            metrics.inc("rate_limited_total", bucket=UPLOAD_BUDGET)
+            limiter.penalize(client.api_key, UPLOAD_BUDGET, RATE_LIMIT_PAUSE)
         logger.error(f"Upload failed for {os.path.basename(path)}: {str(e)}")
         raise
 
-@sleep_and_retry
-@limits(calls=CALLS_PER_SECOND, period=PERIOD)
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def process_file_with_retry(chat_session, file):
+def upload_chunk(client, chunk_path, content_hash, registry=None, model_name=None):
+    """Return a remote file with the chunk's audio, reusing an earlier upload of the same audio while it is still usable.
+
+    Uploads are only forgotten once the chunk's transcript is stored (see
+    release_upload), so a chunk that failed after uploading is not uploaded
+    again when it is retried, in this run or a later one. The returned file is
+    held for the chunk until release_upload is called for it.
+    """
+    registry = registry or get_default_registry()
+    name = registry.get(client.api_key, content_hash)
+    if name is not None:
+        # Held before it is checked, so a chunk finishing with the same file can't delete it in between
+        registry.hold(client.api_key, name)
+        try:
+            file = client.get_file(name)
+            if file.state.name == "ACTIVE":
+                metrics.inc("upload_reuses_total")
+                logger.info(f"Reusing uploaded file {name} for {os.path.basename(chunk_path)}")
+                return file
+        except Exception as e:
+            logger.debug(f"Uploaded file {name} is no longer available: {str(e)}")
+        registry.release(client.api_key, name)
+        registry.remove(client.api_key, content_hash, name)
+    
+    file = upload_to_gemini_with_retry(client, chunk_path, mime_type=audio_mime_type(chunk_path), model_name=model_name)
+    registry.hold(client.api_key, file.name)
+    expiration = getattr(file, "expiration_time", None)
+    registry.put(client.api_key, content_hash, file.name, expiration.timestamp() if expiration else None)
+    return file
+
+def release_upload(client, file, content_hash, registry=None, delete=True):
+    """Let go of a chunk's remote file, deleting it once its transcript is stored instead of leaving it to count against storage for 48 hours.
+
+    The file is only deleted when no other chunk in the process, e.g. of a
+    concurrent job for the same video, still holds it. With delete=False, for a
+    chunk that failed, the file is kept for the next attempt.
+    """
+    registry = registry or get_default_registry()
+    if not registry.release(client.api_key, file.name) or not delete:
+        return
+    registry.remove(client.api_key, content_hash, file.name)
+    try:
+        client.delete_file(file.name)
+        metrics.inc("remote_files_deleted_total")
+    except Exception as e:
+        logger.warning(f"Could not delete uploaded file {file.name}: {str(e)}")
+
+def rate_limited_call(client, model_name, estimated_tokens, call, limiter=None):
+    """Run a generation call inside the shared rate limit and settle its token usage."""
+    limiter = limiter or get_default_limiter()
+    with metrics.span("rate_limit_wait"):
+        limiter.acquire(client.api_key, model_name, estimated_tokens)
+    try:
+        with metrics.span("generate", model=model_name):
+            response = call()
+    except Exception as e:
+        record_failure(client, model_name, e, limiter)
+        raise
+    return record_usage(client, model_name, estimated_tokens, response, limiter)
+
+def record_failure(client, model_name, error, limiter):
+    """Count a failed generation call against its backend, and pause every worker on the key after a 429."""
+    get_health().record_failure(client.api_key, model_name, error)
+    if is_rate_limit_error(error):
+        metrics.inc("rate_limited_total", bucket=model_name)
+        limiter.penalize(client.api_key, model_name, RATE_LIMIT_PAUSE)
+
+def record_usage(client, model_name, estimated_tokens, response, limiter):
+    """Mark the backend healthy, settle the token budget with what the call actually used, and count its tokens."""
+    get_health().record_success(client.api_key, model_name)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        metrics.inc("tokens_total", usage.prompt_token_count or 0, model=model_name, type="prompt")
+        metrics.inc("tokens_total", usage.candidates_token_count or 0, model=model_name, type="output")
+        if usage.total_token_count:
+            limiter.adjust(client.api_key, model_name, usage.total_token_count - estimated_tokens)
+    return response
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), before_sleep=metrics.count_retry("generate"))
+def process_file_with_retry(client, model, file, prompt, estimated_tokens=0, limiter=None, model_name=MODEL_NAME, generation_config=None):
     try:
         logger.debug(f"Processing: {file.display_name}")
-        response = chat_session.send_message(
-            "Generate audio diarization, including transcriptions and speaker information for each transcription. "
-            "Organize the transcription by the time they happened. No time stamps. "
-            "Infer speaker name from the audio. Text output only, no JSON formatting."
+        # One request with the audio and the instructions; no chat history to pay for twice
+        return rate_limited_call(
+            client, model_name, estimated_tokens,
+            lambda: model.generate_content([file, prompt], generation_config=generation_config),
+            limiter,
         )
-        return response
     except Exception as e:
         logger.error(f"Processing failed for {file.display_name}: {str(e)}")
         raise
 
-def process_audio_file(audio_path, original_title=None):
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), before_sleep=metrics.count_retry("attribute"))
+def attribute_speakers_with_retry(client, model, prompt, limiter=None, model_name=MODEL_NAME):
     try:
-        generation_config = {
-            "temperature": 0.3,
-            "top_p": 0.95,
-            "top_k": 40,
-            "response_mime_type": "text/plain",
-        }
-
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=generation_config,
+        # Roughly 4 characters per token for English text
+        estimated_tokens = len(prompt) // 4 + MAX_OUTPUT_TOKENS
+        return rate_limited_call(
+            client, model_name, estimated_tokens,
+            lambda: model.generate_content(prompt),
+            limiter,
         )
+    except Exception as e:
+        logger.error(f"Speaker attribution failed: {str(e)}")
+        raise
 
-        # Split audio into 20-minute chunks (to be safe)
-        chunk_duration = 20 * 60  # 20 minutes in seconds
-        chunks = split_audio(audio_path, chunk_duration)
-        
-        all_transcripts = []
+@retry(stop=stop_after_attempt(2), wait=wait_exponential(multiplier=1, min=4, max=10), before_sleep=metrics.count_retry("roster"))
+def generate_roster_with_retry(client, model, prompt, limiter=None, model_name=MODEL_NAME):
+    return rate_limited_call(
+        client, model_name, len(prompt) // 4 + ROSTER_OUTPUT_TOKENS,
+        lambda: model.generate_content(prompt),
+        limiter,
+    )
+
+def roster_cache_key(video_id):
+    return make_key("roster", video_id=video_id, model_name=models_cache_name(), generation_config=GENERATION_CONFIG, prompt=ROSTER_PROMPT)
+
+def roster_prompt(metadata):
+    lines = [f"Title: {metadata.get('title')}", f"Channel: {metadata.get('uploader') or 'unknown'}"]
+    description = (metadata.get("description") or "").strip()[:ROSTER_DESCRIPTION_CHARS]
+    if description:
+        lines.append(f"Description:\n{description}")
+    chapters = [chapter.get("title") for chapter in metadata.get("chapters") or [] if chapter.get("title")]
+    if chapters:
+        lines.append("Chapters:\n" + "\n".join(chapters))
+    return ROSTER_PROMPT + "\n".join(lines)
+
+def get_speaker_roster(pool, metadata, cache=None):
+    """Return the likely speakers of a video and names that are easy to misspell, as text for the chunk prompts.
+
+    One short text-only call on the video's title and description, so every
+    chunk can be given the same names while the chunks still run in parallel.
+    The roster is cached per video, and save_chunk_plan caches whatever roster
+    the chunks were given even when it is empty, so a retried video gets the
+    same one, and with it the same chunk cache keys. Returns "" when ROSTER_PASS
+    is off or the call fails, in which case chunks infer names from the audio alone.
+    """
+    if not ROSTER_PASS or not metadata or not metadata.get("title"):
+        return ""
+    video_id = metadata.get("id")
+    if cache is not None and video_id:
+        cached = cache_lookup(cache, roster_cache_key(video_id), "roster")
+        if cached is not None:
+            return cached["roster"]
+    prompt = roster_prompt(metadata)
+    try:
+        backend = pool.choose(len(prompt) // 4 + ROSTER_OUTPUT_TOKENS)
+        with metrics.span("roster"):
+            response = generate_roster_with_retry(backend.client, backend.model(), prompt, model_name=backend.model_name)
+        roster = response.text.strip()
+    except Exception as e:
+        logger.warning(f"Could not get a speaker roster for {video_id or metadata['title']}: {describe_error(e)}")
+        return ""
+    if cache is not None and video_id:
+        cache.put(roster_cache_key(video_id), {"roster": roster}, kind="roster", video_id=video_id)
+    return roster
+
+def is_truncated(response):
+    """Return True when generation stopped because it ran into MAX_OUTPUT_TOKENS."""
+    candidates = getattr(response, "candidates", None) or []
+    return bool(candidates) and getattr(candidates[0].finish_reason, "name", None) == "MAX_TOKENS"
+
+def output_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return usage.candidates_token_count if usage is not None else 0
+
+def chunk_token_estimate(duration=None):
+    """Tokens a chunk call is expected to use: its audio plus a full transcript."""
+    return (duration or CHUNK_DURATION) * AUDIO_TOKENS_PER_SECOND + MAX_OUTPUT_TOKENS
+
+def find_cached_chunk(chunk_path, part, total_parts, model_names, video_id=None, cache=None, roster="", on_progress=None):
+    """Hash a chunk and look its transcript up, returning (content_hash, cached result or None).
+
+    A chunk found in the cache is done: its file is removed and it is reported
+    as transcribed.
+    """
+    logger.info(f"Processing chunk {part}/{total_parts}")
+    content_hash = hash_file(chunk_path)
+    if cache is None:
+        return content_hash, None
+    cached = lookup_cached_chunk(cache, video_id, content_hash, model_names, roster)
+    if cached is None:
+        return content_hash, None
+    os.remove(chunk_path)
+    logger.info(f"Cache hit for chunk {part}/{total_parts}")
+    emit(on_progress, "chunk_transcribed", part=part, total=total_parts, transcript=chunk_text(cached["transcript"]), cached=True)
+    return content_hash, cached["transcript"]
+
+def read_chunk_response(response, duration=None, speech=None):
+    """Return a chunk's result and whether it was cut off at MAX_OUTPUT_TOKENS.
+
+    Also teaches the chunk planner how much text a minute of this kind of speech produces.
+    """
+    truncated = is_truncated(response)
+    get_default_density().observe(MAX_OUTPUT_TOKENS if truncated else output_tokens(response), speech)
+    return chunk_result(response, duration), truncated
+
+def cache_chunk(cache, video_id, content_hash, model_name, roster, result):
+    if cache is not None:
+        key = chunk_cache_key(video_id, content_hash, model_name, roster)
+        cache.put(key, {"transcript": result}, kind="chunk", video_id=video_id)
+
+def finish_chunk(client, file, content_hash, chunk_path, part, total_parts, result, on_progress=None):
+    """Let go of a transcribed chunk's upload, remove its file and report it."""
+    release_upload(client, file, content_hash)
+    os.remove(chunk_path)
+    logger.info(f"Finished chunk {part}/{total_parts}")
+    emit(on_progress, "chunk_transcribed", part=part, total=total_parts, transcript=chunk_text(result), cached=False)
+
+def remove_chunk_files(chunks):
+    """Delete the files of chunks that never finished, e.g. after a failure or cancellation."""
+    for chunk in chunks:
+        if os.path.exists(chunk["path"]):
+            os.remove(chunk["path"])
+
+def transcribe_chunk(pool, chunk_path, part, total_parts, video_id=None, cache=None, cancel_event=None, on_progress=None, duration=None, speech=None, roster="", depth=0):
+    check_cancelled(cancel_event)
+    content_hash, cached = find_cached_chunk(chunk_path, part, total_parts, pool.model_names, video_id, cache, roster, on_progress)
+    if cached is not None:
+        return cached
+    
+    # The upload belongs to the chosen key, so the whole attempt stays on this backend
+    estimated_tokens = chunk_token_estimate(duration)
+    backend = pool.choose(estimated_tokens)
+    client = backend.client
+    file = upload_chunk(client, chunk_path, content_hash, model_name=backend.model_name)
+    try:
+        emit(on_progress, "chunk_uploaded", part=part, total=total_parts)
         
-        # Process each chunk
-        for i, chunk_path in enumerate(chunks, 1):
-            logger.info(f"Processing chunk {i}/{len(chunks)}")
-            file = upload_to_gemini_with_retry(chunk_path, mime_type="audio/mpeg")
-            
-            chat_session = model.start_chat(
-                history=[
-                    {
-                        "role": "user",
-                        "parts": [
-                            file,
-                            "Generate audio diarization, including transcriptions and speaker information for each transcription. "
-                            "Organize the transcription by the time they happened. No time stamps. "
-                            "Infer speaker name from the audio. Text output only, no JSON formatting."
-                            "New line between each speaker's transcript."
-                            "If it's a single speaker, break it into paragraphs."
-                            f"This is part {i} of {len(chunks)}."
-                        ],
-                    }
-                ]
+        response = process_file_with_retry(
+            client, backend.model(), file, chunk_prompt(part, total_parts, roster), estimated_tokens,
+            model_name=backend.model_name, generation_config=chunk_generation_config(),
+        )
+        transcript, truncated = read_chunk_response(response, duration, speech)
+        if truncated:
+            transcript = transcribe_in_halves(
+                pool, chunk_path, part, total_parts, video_id, cache, cancel_event, duration, roster, depth
+            ) or transcript
+        cache_chunk(cache, video_id, content_hash, backend.model_name, roster, transcript)
+    except BaseException:
+        # Keep the upload for the next attempt at this chunk
+        release_upload(client, file, content_hash, delete=False)
+        raise
+    finish_chunk(client, file, content_hash, chunk_path, part, total_parts, transcript, on_progress)
+    return transcript
+
+def plan_resplit(chunk_path, part, total_parts, duration=None, depth=0):
+    """Return the two spans to transcribe a chunk whose transcript was cut off again as, or None to keep the cut-off transcript.
+
+    The halves are cut near the middle, so both stay at least MIN_CHUNK_DURATION
+    long, and a chunk is split at most MAX_RESPLIT_DEPTH times over, so audio
+    the model can't fit in its output is only paid for a bounded number of times.
+    """
+    if depth >= MAX_RESPLIT_DEPTH:
+        logger.warning(f"Chunk {part}/{total_parts} hit the output token limit after {depth} splits, keeping the truncated transcript")
+        return None
+    if not duration:
+        duration = get_audio_duration(chunk_path)
+    if duration < 2 * MIN_CHUNK_DURATION + SILENCE_SEARCH_WINDOW:
+        logger.warning(f"Chunk {part}/{total_parts} hit the output token limit and is too short to split, keeping the truncated transcript")
+        return None
+    logger.warning(f"Chunk {part}/{total_parts} hit the output token limit, transcribing it again in two halves")
+    return list(iter_overlapping_spans(split_span(duration, iter_silences(chunk_path)), CHUNK_OVERLAP))
+
+def transcribe_in_halves(pool, chunk_path, part, total_parts, video_id=None, cache=None, cancel_event=None, duration=None, roster="", depth=0):
+    """Transcribe a chunk whose transcript was cut off again as two shorter chunks and merge the results.
+
+    Returns None when the chunk is not split again (see plan_resplit).
+    """
+    plan = plan_resplit(chunk_path, part, total_parts, duration, depth)
+    if plan is None:
+        return None
+    halves = []
+    try:
+        for half in iter_planned_chunks(chunk_path, None, plan=plan):
+            halves.append(half)
+        return merge_halves(halves, [
+            transcribe_chunk(
+                pool, half["path"], part, total_parts, video_id, cache, cancel_event,
+                duration=half["duration"], speech=half["speech"], roster=roster, depth=depth + 1,
             )
+            for half in halves
+        ])
+    finally:
+        remove_chunk_files(halves)
 
-            response = process_file_with_retry(chat_session, file)
-            all_transcripts.append(response.text)
-            
-            # Clean up chunk file
-            os.remove(chunk_path)
+def transcribe_chunk_with_retries(pool, chunk, part, total_parts, video_id=None, cache=None, cancel_event=None, on_progress=None, roster="", entry_log=None, rounds=CHUNK_RETRY_ROUNDS):
+    """Transcribe a chunk, starting it over after a pause if all of the call-level retries fail.
+
+    The chunk file is kept until its transcript is stored and its upload is
+    reused, so another round usually costs a single generate call. Each round
+    picks a backend again, so a key that keeps failing is left for another.
+    In structured mode the chunk's entries are appended to `entry_log` and the
+    chunk is returned rendered as markdown.
+    """
+    for attempt in range(rounds + 1):
+        try:
+            result = transcribe_chunk(
+                pool, chunk["path"], part, total_parts, video_id, cache, cancel_event, on_progress,
+                chunk["duration"], chunk["speech"], roster,
+            )
+        except JobCancelled:
+            raise
+        except Exception as e:
+            if attempt == rounds:
+                raise
+            sleep_unless_cancelled(chunk_retry_pause(e, attempt, part, total_parts), cancel_event)
+        else:
+            return record_chunk(result, chunk, part, entry_log)
+
+def chunk_retry_pause(error, attempt, part, total_parts):
+    """Return how long to wait before the next round at a failed chunk, doubling every round."""
+    pause = CHUNK_RETRY_DELAY * 2 ** attempt
+    logger.warning(f"Chunk {part}/{total_parts} failed ({describe_error(error)}), trying it again in {pause}s")
+    metrics.inc("retries_total", call="chunk")
+    return pause
+
+def sleep_unless_cancelled(seconds, cancel_event=None):
+    """Sleep, raising JobCancelled as soon as the job is cancelled."""
+    if cancel_event is None:
+        time.sleep(seconds)
+    elif cancel_event.wait(seconds):
+        raise JobCancelled("Job was cancelled")
+
+def give_up_on_chunk(errors, index, total_parts, error):
+    """Record why a chunk failed every retry; finish_transcript puts a gap marker in its place."""
+    errors[index] = describe_error(error)
+    logger.error(f"Giving up on chunk {index + 1}/{total_parts}: {errors[index]}")
+
+def chunk_plan_key(video_id):
+    return make_key(
+        "plan", video_id=video_id, chunk_duration=CHUNK_DURATION, max_chunk_duration=MAX_CHUNK_DURATION,
+        adaptive=ADAPTIVE_CHUNKS, overlap=CHUNK_OVERLAP,
+    )
+
+def load_chunk_plan(cache, video_id):
+    """Return the spans a video was cut into last time, so the same chunks (and their cached transcripts) come out again.
+
+    Adaptive planning depends on what earlier responses looked like, so without
+    this a second attempt at a video could cut it differently.
+    """
+    if cache is None or not video_id or not SILENCE_AWARE:
+        return None
+    return cache_lookup(cache, chunk_plan_key(video_id), "plan")
+
+def save_chunk_plan(cache, video_id, chunks, roster=""):
+    """Remember the spans a video was cut into and the roster its chunks were given, for the next attempt at it."""
+    if cache is None or not video_id:
+        return
+    if chunks and ROSTER_PASS:
+        # A roster call that failed left the chunks without one; a retry that got one would miss their cached transcripts
+        cache.put(roster_cache_key(video_id), {"roster": roster}, kind="roster", video_id=video_id)
+    if not SILENCE_AWARE:
+        return
+    plan = [[chunk["start"], chunk["end"], chunk["speech"]] for chunk in chunks]
+    cache.put(chunk_plan_key(video_id), plan, kind="plan", video_id=video_id)
+
+def finish_transcript(all_transcripts, audio_path, original_title=None, video_id=None, cache=None, chunk_duration=CHUNK_DURATION, errors=None, entry_log=None):
+    """Combine, save and cache the chunk transcripts, in order.
+
+    Chunks that failed are None in `all_transcripts`. They are replaced with gap
+    markers, the partial transcript is saved but not cached, and
+    IncompleteTranscript is raised so the video can be tried again later; the
+    chunks that did succeed come from the cache then. With an `entry_log` its
+    entries are also rendered as SRT and WebVTT next to the transcript.
+    """
+    errors = errors or {}
+    total = len(all_transcripts)
+    missing = [i + 1 for i, transcript in enumerate(all_transcripts) if transcript is None]
+    
+    # Combine all transcripts, merging only the parts that actually meet at a seam. Only planned
+    # chunks overlap, and structured entries from the overlap are already dropped (record_chunk)
+    overlap = CHUNK_OVERLAP if SILENCE_AWARE and not STRUCTURED_OUTPUT else 0
+    sections = []
+    run = []
+    for i, transcript in enumerate(all_transcripts):
+        if transcript is not None:
+            run.append(transcript)
+            continue
+        if run:
+            sections.append(combine_parts(run, overlap))
+            run = []
+        sections.append(GAP_MARKER.format(part=i + 1, total=total, error=errors.get(i, "unknown error")))
+    if run:
+        sections.append(combine_parts(run, overlap))
+    combined_transcript = "\n\n".join(sections)
 
-        # Combine all transcripts
-        combined_transcript = "\n\n=== Part Break ===\n\n".join(all_transcripts)
+    base_name = transcript_base_name(original_title, audio_path)
+    save_transcript(combined_transcript, base_name)
+    entries = None
+    if entry_log is not None:
+        entries = entry_log.read()
+        with metrics.span("write"):
+            write_renderings(os.path.splitext(entry_log.path)[0], entries)
+    if missing:
+        raise IncompleteTranscript(combined_transcript, missing, total)
+    
+    if cache is not None and video_id:
+        value = {"title": original_title, "transcript": combined_transcript}
+        if entries is not None:
+            value["entries"] = entries
+        cache.put(video_cache_key(video_id, chunk_duration), value, kind="video", video_id=video_id)
+    return combined_transcript  # Return the transcript content
+
+def plan_chunking(density=None):
+    """Return the longest chunk to cut, in seconds, and the seconds of speech to put in each one.
+
+    The speech budget is None when chunks are simply CHUNK_DURATION long.
+    """
+    if not (ADAPTIVE_CHUNKS and SILENCE_AWARE):
+        return CHUNK_DURATION, None
+    density = density or get_default_density()
+    return MAX_CHUNK_DURATION, density.speech_budget(MAX_OUTPUT_TOKENS)
+
+def plan_split(audio_path, video_id=None, cache=None, duration=None, speech_optimize=SPEECH_OPTIMIZE):
+    """Work out how a video's audio is cut, reusing the plan of an earlier attempt at it.
+
+    Returns {"chunks", "total_parts", "plan"}: the chunks, cut as the iterator
+    advances (see iter_chunks), how many of them to expect, and the saved plan
+    they follow or None. Runs ffprobe and reads the cache, so it blocks.
+    """
+    chunk_duration, speech_budget = plan_chunking()
+    if not duration:
+        duration = get_audio_duration(audio_path)
+    speech_optimize = should_speech_optimize(audio_path, speech_optimize)
+    plan = load_chunk_plan(cache, video_id)
+    if plan is not None:
+        total_parts = len(plan)
+    else:
+        total_parts = max(1, math.ceil(duration / min(chunk_duration, speech_budget or chunk_duration)))
+    return {
+        "chunks": iter_chunks(
+            audio_path, chunk_duration, speech_optimize, duration, speech_budget, plan,
+            silence_aware=SILENCE_AWARE, overlap=CHUNK_OVERLAP,
+        ),
+        "total_parts": total_parts,
+        "plan": plan,
+    }
 
-        # Save combined transcript
-        transcript_dir = "transcripts_better"
-        os.makedirs(transcript_dir, exist_ok=True)
+def process_audio_file(audio_path, original_title=None, max_chunk_workers=MAX_CHUNK_WORKERS, video_id=None, cache=None, duration=None, speech_optimize=SPEECH_OPTIMIZE, cancel_event=None, on_progress=None, client=None, metadata=None):
+    try:
+        pool = resolve_pool(client)
+        split = plan_split(audio_path, video_id, cache, duration, speech_optimize)
+        total_parts = split["total_parts"]
         
-        if original_title:
-            base_name = sanitize_filename(original_title)
-        else:
-            base_name = sanitize_filename(os.path.splitext(os.path.basename(audio_path))[0])
-            
-        transcript_path = os.path.join(transcript_dir, f"transcript_{base_name}.md")
+        # Process chunks concurrently, keeping results in chunk order
+        chunks = []
+        transcripts_by_index = {}
+        errors = {}
+        entry_log = open_entry_log(audio_path, original_title, video_id)
+        with ThreadPoolExecutor(max_workers=max(1, max_chunk_workers)) as executor:
+            future_to_index = {}
+            # Fetched while ffmpeg looks for the first cut; every chunk waits for the same roster
+            roster_future = executor.submit(get_speaker_roster, pool, metadata, cache)
+            try:
+                # Start transcribing each chunk as soon as ffmpeg has written it
+                with metrics.span("split"):
+                    for i, chunk in enumerate(split["chunks"], 1):
+                        chunks.append(chunk)
+                        check_cancelled(cancel_event)
+                        future = executor.submit(
+                            transcribe_chunk_with_retries, pool, chunk, i, max(total_parts, i), video_id, cache, cancel_event, on_progress,
+                            roster_future.result(), entry_log,
+                        )
+                        future_to_index[future] = i - 1
+                emit(on_progress, "split", chunks=len(chunks))
+                if split["plan"] is None:
+                    save_chunk_plan(cache, video_id, chunks, roster_future.result())
+                # A chunk that fails every retry leaves a gap instead of losing the others
+                for future in as_completed(future_to_index):
+                    index = future_to_index[future]
+                    try:
+                        transcripts_by_index[index] = future.result()
+                    except JobCancelled:
+                        raise
+                    except Exception as e:
+                        give_up_on_chunk(errors, index, len(chunks), e)
+            finally:
+                # Don't start chunks that are still queued, and drop leftover chunk files
+                executor.shutdown(wait=True, cancel_futures=True)
+                remove_chunk_files(chunks)
         
-        with open(transcript_path, 'w', encoding='utf-8') as f:
-            f.write(combined_transcript)
-            
-        logger.info(f"✓ Transcript saved: {transcript_path}")
-        return combined_transcript  # Return the transcript content
+        all_transcripts = [transcripts_by_index.get(i) for i in range(len(chunks))]
+        return finish_transcript(all_transcripts, audio_path, original_title, video_id, cache, errors=errors, entry_log=entry_log)
         
+    except (JobCancelled, IncompleteTranscript) as e:
+        if isinstance(e, JobCancelled):
+            logger.info(f"Cancelled processing of {audio_path}")
+        raise
     except Exception as e:
         logger.error(f"Failed to process {audio_path}: {str(e)}")
         return None
 
-def split_audio(audio_path, chunk_duration):
-    """Split audio file into chunks of specified duration."""
-    audio = AudioSegment.from_mp3(audio_path)
-    duration_ms = len(audio)
-    chunk_duration_ms = chunk_duration * 1000
+def probe_audio(audio_path, entry):
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-show_entries", f"format={entry}",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            audio_path,
+        ],
+        capture_output=True, text=True, check=True,
+    )
+    return result.stdout.strip()
+
+def get_audio_duration(audio_path):
+    """Return the duration of an audio file in seconds, read from the container by ffprobe."""
+    return float(probe_audio(audio_path, "duration"))
+
+def get_audio_bitrate(audio_path):
+    """Return the overall bitrate of an audio file in bits per second."""
+    try:
+        return int(probe_audio(audio_path, "bit_rate"))
+    except ValueError:
+        # Some containers don't report a bitrate; estimate it from size and duration
+        return int(os.path.getsize(audio_path) * 8 / get_audio_duration(audio_path))
+
+def should_speech_optimize(audio_path, speech_optimize=SPEECH_OPTIMIZE):
+    # Only re-encode for speech when it actually makes the upload smaller
+    return speech_optimize and get_audio_bitrate(audio_path) > SPEECH_BITRATE * 1000
+
+def chunk_format(audio_path, speech_optimize=False):
+    """Return the extension and ffmpeg codec arguments used for the chunks of a file."""
+    if speech_optimize:
+        codec_args = [
+            "-ac", "1", "-ar", "16000",
+            "-c:a", "libopus", "-b:a", f"{SPEECH_BITRATE}k", "-application", "voip",
+        ]
+        return ".ogg", codec_args
+    ext = os.path.splitext(audio_path)[1].lower()
+    return REMUX_CONTAINERS.get(ext, ext), ["-c", "copy"]
+
+def iter_audio_chunks(audio_path, chunk_duration, speech_optimize=False):
+    """Yield chunk files of the given duration as soon as ffmpeg finishes writing each one.
+
+    The audio is cut with the segment muxer and stream copy, so it is never decoded
+    and memory use does not depend on the length of the file. Streams in containers
+    Gemini doesn't accept are copied into one it does. With speech_optimize the chunks
+    are instead re-encoded to low bitrate mono Opus.
+    """
+    output_dir = os.path.dirname(audio_path)
+    ext, codec_args = chunk_format(audio_path, speech_optimize)
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-i", audio_path,
+        "-map", "0:a", *codec_args, *BITEXACT_ARGS,
+        "-f", "segment",
+        "-segment_time", str(chunk_duration),
+        "-reset_timestamps", "1",
+        # ffmpeg prints each segment's name here once the segment is closed
+        "-segment_list", "pipe:1",
+        "-segment_list_type", "flat",
+        f"{audio_path}_chunk_%d{ext}",
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        for line in process.stdout:
+            name = line.strip()
+            if name:
+                yield os.path.join(output_dir, os.path.basename(name))
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to split {audio_path}: {stderr.strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+def cut_audio(audio_path, start, end, chunk_path, codec_args):
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-ss", f"{start:.3f}", "-i", audio_path,
+        "-t", f"{end - start:.3f}",
+        "-map", "0:a", *codec_args, *BITEXACT_ARGS,
+        chunk_path,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to cut {audio_path}: {result.stderr.strip()}")
+
+def iter_overlapping_spans(spans, overlap):
+    for i, (start, end, speech) in enumerate(spans):
+        yield (max(0.0, start - overlap) if i else start), end, speech
+
+def iter_planned_chunks(audio_path, chunk_duration, speech_optimize=False, duration=None, overlap=None, speech_budget=None, plan=None):
+    """Yield chunks that end in pauses, cutting each one as soon as its end is known.
+
+    Each chunk after the first also repeats the last `overlap` seconds of the one
+    before it, so a sentence cut at a hard boundary is heard whole at least once;
+    merge_transcripts removes the doubled text again. With a `speech_budget` each
+    chunk holds about that many seconds of speech (see iter_chunk_spans). A `plan`
+    of (start, end, speech) spans from an earlier run is cut as is. `overlap`
+    defaults to CHUNK_OVERLAP as it is when the chunks are planned.
+    """
+    if overlap is None:
+        overlap = CHUNK_OVERLAP
+    ext, codec_args = chunk_format(audio_path, speech_optimize)
+    if plan is not None:
+        spans = iter(plan)
+    else:
+        if not duration:
+            duration = get_audio_duration(audio_path)
+        planned = iter_chunk_spans(duration, chunk_duration, iter_silences(audio_path), speech_budget=speech_budget)
+        spans = iter_overlapping_spans(planned, overlap)
+    try:
+        for i, (start, end, speech) in enumerate(spans):
+            chunk_path = f"{audio_path}_chunk_{i}{ext}"
+            cut_audio(audio_path, start, end, chunk_path, codec_args)
+            yield {"path": chunk_path, "start": start, "end": end, "duration": end - start, "speech": speech}
+    finally:
+        if plan is None:
+            planned.close()
+
+def iter_chunks(audio_path, chunk_duration, speech_optimize=False, duration=None, speech_budget=None, plan=None, silence_aware=None, overlap=None):
+    """Yield {path, start, end, duration, speech} for each chunk of the audio, in order.
+
+    Offsets and durations are only known for silence-aware chunks; they are None otherwise.
+    `silence_aware` and `overlap` default to SILENCE_AWARE and CHUNK_OVERLAP.
+    """
+    if silence_aware is None:
+        silence_aware = SILENCE_AWARE
+    if silence_aware:
+        yield from iter_planned_chunks(audio_path, chunk_duration, speech_optimize, duration, overlap, speech_budget, plan)
+        return
+    for chunk_path in iter_audio_chunks(audio_path, chunk_duration, speech_optimize):
+        yield {"path": chunk_path, "start": None, "end": None, "duration": None, "speech": None}
+
+def captions_cache_key(video_id, captions_mode, attribute=CAPTION_ATTRIBUTION):
+    return make_key(
+        "captions",
+        video_id=video_id,
+        captions_mode=captions_mode,
+        model_name=models_cache_name() if attribute else None,
+        generation_config=GENERATION_CONFIG if attribute else None,
+        prompt=SPEAKER_ATTRIBUTION_PROMPT if attribute else None,
+        chunk_duration=CHUNK_DURATION,
+    )
+
+def transcribe_from_captions(video_id, client=None, cache=None, captions_mode=CAPTIONS_MODE,
+                             attribute=CAPTION_ATTRIBUTION, max_chunk_workers=MAX_CHUNK_WORKERS):
+    """Build the transcript from the video's YouTube captions without downloading any audio.
+
+    Returns None when captions are off, missing or not good enough, so the caller
+    can fall back to transcribing the audio.
+    """
+    if captions_mode not in CAPTION_MODES:
+        raise ValueError(f"Unknown captions mode: {captions_mode}")
+    if captions_mode == "off" or not video_id:
+        return None
+    
+    key = captions_cache_key(video_id, captions_mode, attribute)
+    if cache is not None:
+        cached = cache_lookup(cache, key, "captions")
+        if cached is not None:
+            logger.info(f"Cache hit for captions of {video_id}")
+            save_transcript(cached["transcript"], sanitize_filename(cached["title"] or video_id))
+            return cached["transcript"]
     
-    chunks = []
-    for i in range(0, duration_ms, chunk_duration_ms):
-        chunk = audio[i:i + chunk_duration_ms]
-        chunk_path = f"{audio_path}_chunk_{i//chunk_duration_ms}.mp3"
-        chunk.export(chunk_path, format="mp3")
-        chunks.append(chunk_path)
+    with metrics.span("captions"):
+        segments = fetch_captions(video_id, captions_mode)
+    if not segments:
+        return None
+    title = fetch_title(video_id)
+    blocks = group_captions(segments, CHUNK_DURATION)
+    
+    if attribute:
+        pool = resolve_pool(client)
+        prompts = [
+            SPEAKER_ATTRIBUTION_PROMPT.format(part=i, total=len(blocks), title=title or video_id) + block
+            for i, block in enumerate(blocks, 1)
+        ]
+        def attribute(prompt):
+            backend = pool.choose(len(prompt) // 4 + MAX_OUTPUT_TOKENS)
+            return attribute_speakers_with_retry(backend.client, backend.model(), prompt, model_name=backend.model_name)
+        # Text-only calls, still in parallel and in order
+        with ThreadPoolExecutor(max_workers=max(1, max_chunk_workers)) as executor:
+            parts = [response.text for response in executor.map(attribute, prompts)]
+    else:
+        parts = blocks
     
-    return chunks
+    transcript = combine_parts(parts)
+    save_transcript(transcript, sanitize_filename(title or video_id))
+    if cache is not None:
+        cache.put(key, {"title": title, "transcript": transcript}, kind="captions", video_id=video_id)
+    return transcript
+
+def lookup_cached_video(url, cache):
+    """Return the URL's video ID and its cached transcript entry, if there is one."""
+    video_id = extract_video_id(url)
+    if cache is None or not video_id:
+        return video_id, None
+    cached = cache_lookup(cache, video_cache_key(video_id), "video")
+    if cached is not None:
+        logger.info(f"Cache hit for {url}")
+        save_transcript(cached["transcript"], sanitize_filename(cached["title"] or video_id))
+        if cached.get("entries") is not None:
+            save_structured_transcript(cached["entries"], sanitize_filename(cached["title"] or video_id), video_id)
+    return video_id, cached
+
+def transcribe_without_audio(url, cache=None, client=None, captions_mode=CAPTIONS_MODE, on_progress=None):
+    """Return (video_id, transcript) from the cache or the video's captions; the transcript is None when the audio is needed."""
+    video_id, cached = lookup_cached_video(url, cache)
+    if cached is not None:
+        emit(on_progress, "cached", title=cached["title"])
+        return video_id, cached["transcript"]
+    # Use the video's own captions when allowed and good enough
+    transcript = transcribe_from_captions(video_id, client, cache, captions_mode)
+    if transcript is not None:
+        emit(on_progress, "captions")
+    return video_id, transcript
 
-def process_youtube_url(url):
+def incomplete_result(url, error, on_progress=None):
+    """Report a video whose chunks did not all succeed, returning (False, partial transcript)."""
+    logger.error(f"Incomplete transcript for {url}: {str(error)}")
+    metrics.inc("videos_total", result="incomplete")
+    emit(on_progress, "incomplete", missing=error.missing, total=error.total)
+    # Every part failing is no better than a plain failure
+    return False, (error.transcript if len(error.missing) < error.total else None)
+
+def process_youtube_url(url, cache=None, cancel_event=None, on_progress=None, client=None, captions_mode=CAPTIONS_MODE, work_dir=None, disk_budget=None):
+    """Transcribe one video and return (success, transcript).
+
+    Audio and chunks are written to work_dir, which the caller owns. Without one
+    the video gets a private workspace, reserved from disk_budget if given, that
+    is deleted when it finishes.
+    """
+    if cache is None:
+        cache = get_default_cache()
+    workspace = None
     try:
-        audio_path, original_title = download_audio(url)
+        # Skip the download entirely if this video was already transcribed with the same settings
+        video_id, transcript_content = transcribe_without_audio(url, cache, client, captions_mode, on_progress)
+        if transcript_content is not None:
+            metrics.inc("videos_total", result="succeeded")
+            return True, transcript_content
+        check_cancelled(cancel_event)
+        
+        if work_dir is None:
+            workspace = Workspace(disk_budget).open(cancel_event)
+            if workspace is None:
+                raise JobCancelled()
+            work_dir = workspace.path
+        audio_path, metadata = download_audio(url, work_dir)
         if not audio_path:
             logger.error(f"Failed to download audio for {url}")
+            metrics.inc("videos_total", result="failed")
             return False, None
+        emit(on_progress, "downloaded", title=metadata["title"], duration=metadata["duration"])
+        check_cancelled(cancel_event)
             
         # Get transcript content
-        transcript_content = process_audio_file(audio_path, original_title)
+        transcript_content = process_audio_file(
+            audio_path,
+            metadata["title"],
+            video_id=metadata["id"] or video_id,
+            cache=cache,
+            duration=metadata["duration"],
+            cancel_event=cancel_event,
+            on_progress=on_progress,
+            client=client,
+            metadata=metadata,
+        )
         
         # Clean up the original audio file
         if os.path.exists(audio_path):
             os.remove(audio_path)
             logger.info(f"Cleaned up audio file: {audio_path}")
-            
-        return True, transcript_content
         
+        metrics.inc("videos_total", result="failed" if transcript_content is None else "succeeded")
+        return transcript_content is not None, transcript_content
+    
+    except IncompleteTranscript as e:
+        return incomplete_result(url, e, on_progress)
+        
+    except JobCancelled:
+        metrics.inc("videos_total", result="cancelled")
+        raise
     except Exception as e:
+        metrics.inc("videos_total", result="failed")
         logger.error(f"Error processing {url}: {str(e)}")
-        if 'audio_path' in locals() and os.path.exists(audio_path):
-            os.remove(audio_path)
         return False, None
+    finally:
+        if 'audio_path' in locals() and audio_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+        if workspace is not None:
+            workspace.close()
+
+def expand_urls(urls):
+    """Replace playlist and channel URLs with the URLs of their videos.
+
+    Uses yt-dlp's flat extraction, which lists the entries without resolving
+    each video, so expanding a large channel only costs a few page loads.
+    """
+    import yt_dlp
+    expanded = []
+    with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': 'in_playlist'}) as ydl:
+        pending = list(urls)
+        while pending:
+            url = pending.pop(0)
+            if not PLAYLIST_PATTERN.search(url):
+                expanded.append(url)
+                continue
+            try:
+                info = ydl.extract_info(url, download=False)
+            except Exception as e:
+                logger.error(f"Could not expand {url}: {str(e)}")
+                continue
+            entries = [entry for entry in info.get('entries') or [] if entry]
+            logger.info(f"Expanded {url} into {len(entries)} entries")
+            nested = []
+            for entry in entries:
+                entry_url = entry.get('url') or entry.get('webpage_url')
+                if entry.get('ie_key') == 'YoutubeTab' and entry_url:
+                    # Channels list their tabs (videos, shorts, ...) as nested playlists
+                    nested.append(entry_url)
+                elif entry.get('id'):
+                    expanded.append(f"https://www.youtube.com/watch?v={entry['id']}")
+                elif entry_url:
+                    expanded.append(entry_url)
+            pending[:0] = nested
+    return expanded
+
+def read_urls(source):
+    """Read URLs from a file, or stdin for "-", one per line, ignoring blanks and # comments."""
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+def run_batch(urls, client, manifest=None, **pipeline_options):
+    """Run URLs through the staged pipeline, recording each result in the manifest, and return a summary."""
+    from pipeline import Pipeline
+    from tqdm import tqdm
+    
+    started = time.time()
+    # Different links to the same video would otherwise be downloaded and transcribed side by side
+    urls = [canonical_url(url) for url in urls]
+    duplicates = len(urls) - len(set(urls))
+    if duplicates:
+        logger.info(f"Ignoring {duplicates} duplicate URLs")
+    pending = manifest.pending(urls) if manifest else list(dict.fromkeys(urls))
+    skipped = len(set(urls)) - len(pending)
+    if skipped:
+        logger.info(f"Skipping {skipped} URLs already completed in the manifest")
+    
+    counts = {"succeeded": 0, "failed": 0}
+    progress = tqdm(total=len(pending), desc="Processing URLs")
+    
+    def on_result(url, success, transcript, error):
+        counts["succeeded" if success else "failed"] += 1
+        progress.update(1)
+        if manifest:
+            manifest.record(url, "succeeded" if success else "failed", error=error)
+    
+    try:
+        Pipeline(client, on_result=on_result, **pipeline_options).run(pending)
+    finally:
+        progress.close()
+    
+    elapsed = time.time() - started
+    return {
+        "total": len(pending) + skipped,
+        "skipped": skipped,
+        "succeeded": counts["succeeded"],
+        "failed": counts["failed"],
+        "elapsed_seconds": round(elapsed, 1),
+        "videos_per_hour": round(counts["succeeded"] / elapsed * 3600, 2) if elapsed and counts["succeeded"] else 0.0,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Transcribe YouTube videos with speaker diarization using Gemini.",
+    )
+    parser.add_argument("urls", nargs="*", help="video, playlist or channel URLs")
+    parser.add_argument("-i", "--input", help='file with one URL per line, or "-" for stdin')
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="batch state file used to resume a crashed run")
+    parser.add_argument("--captions", choices=CAPTION_MODES, default=CAPTIONS_MODE,
+                        help="use YouTube captions instead of the audio when available (manual only, or any)")
+    parser.add_argument("--download-workers", type=int, help="videos downloading at the same time")
+    parser.add_argument("--split-workers", type=int, help="ffmpeg processes cutting audio at the same time")
+    parser.add_argument("--transcribe-workers", type=int, help="chunks sent to Gemini at the same time")
+    parser.add_argument("--metrics", metavar="PATH", help='write stage timings and counters as JSON to PATH, or "-" for stdout')
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    
     # Load environment variables
     load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        logger.error("GEMINI_API_KEY not found in environment variables")
+    try:
+        pool = resolve_pool()
+    except ValueError as e:
+        logger.error(str(e))
         return
-
-    genai.configure(api_key=api_key)
+    remove_stale_workspaces()
     
-    # Get YouTube URLs from user
-    print("Enter YouTube URLs (one per line). Press Enter twice when done:")
-    urls = []
-    while True:
-        url = input().strip()
-        if not url:
-            break
-        urls.append(url)
+    batch = bool(args.urls or args.input)
+    if batch:
+        urls = list(args.urls)
+        if args.input:
+            urls.extend(read_urls(args.input))
+    else:
+        # Get YouTube URLs from user
+        print("Enter YouTube URLs (one per line). Press Enter twice when done:")
+        urls = []
+        while True:
+            url = input().strip()
+            if not url:
+                break
+            urls.append(url)
     
+    urls = expand_urls(urls)
     if not urls:
         logger.error("No URLs provided")
         return
-        
-    # Process URLs concurrently with rate limiting
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Submit all tasks
-        future_to_url = {
-            executor.submit(process_youtube_url, url): url 
-            for url in urls
+    
+    # Only batch runs keep a manifest; interactive runs always start fresh
+    manifest = Manifest(args.manifest) if batch else None
+    try:
+        pipeline_options = {
+            name: value
+            for name, value in (
+                ("download_workers", args.download_workers),
+                ("split_workers", args.split_workers),
+                ("transcribe_workers", args.transcribe_workers),
+            )
+            if value
         }
-        
-        # Process results with progress bar
-        try:
-            for future in tqdm(as_completed(future_to_url, timeout=300), 
-                             total=len(urls), 
-                             desc="Processing URLs"):
-                url = future_to_url[future]
-                try:
-                    success, transcript_content = future.result(timeout=60)
-                    if success:
-                        logger.info(f"Successfully processed: {url}")
-                    else:
-                        logger.error(f"Failed to process: {url}")
-                except Exception as e:
-                    logger.error(f"Exception processing {url}: {str(e)}")
-        except TimeoutError:
-            logger.error("Processing timed out")
-            executor.shutdown(wait=False, cancel_futures=True)
+        summary = run_batch(urls, pool, manifest, captions_mode=args.captions, **pipeline_options)
+    finally:
+        if manifest:
+            manifest.close()
+    
+    logger.info(
+        f"Done: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+        f"{summary['skipped']} skipped in {summary['elapsed_seconds']}s "
+        f"({summary['videos_per_hour']} videos/hour)"
+    )
+    
+    if args.metrics:
+        report = json.dumps({"run": summary, **metrics.get_metrics().summary()}, indent=2)
+        if args.metrics == "-":
+            print(report)
+        else:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                f.write(report)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 